@@ -1,64 +1,179 @@
 # backend/function_app.py
 import azure.functions as func
 import logging
-from datetime import datetime, timedelta
+from datetime import datetime, timezone
 import os
-import json
-from typing import Dict, Any, List
+import time
+from typing import Dict, Any, List, Tuple
 import asyncio
-import aiohttp
-from openai import AzureOpenAI
+import atexit
+import hashlib
+import heapq
+import importlib.util
+import httpx
+import orjson
+from cachetools import TTLCache
 
 # Load environment variables from .env file
 from dotenv import load_dotenv
 load_dotenv()
 
 # Import our models
+from utils.json_response import JSON_HEADERS, json_response, read_json_body
+from services.llm_cache import cached_completion, create_completion, single_flight
 from models.question_models import (
-    QuestionGenerationRequest, 
-    QuestionGenerationResponse,
     ResponseSubmissionRequest,
-    ValidationResult,
-    Question,
     QuestionPriority,
     ResponseType
 )
-from models.common_models import ApiResponse, HealthCheck, Country
 
 # Create the Azure Functions app instance (THIS MUST BE DEFINED BEFORE ANY DECORATORS)
 app = func.FunctionApp(http_auth_level=func.AuthLevel.ANONYMOUS)
 
+# Module logger; messages use lazy %-style arguments so disabled levels skip formatting
+_log = logging.getLogger(__name__)
+
+# Response timestamps only need second resolution, so they are cached per second
+# as [epoch second, naive UTC datetime, ISO string]
+_TS_CACHE = [0, None, ""]
+
+def _utcnow() -> datetime:
+    """Return the current naive UTC time at second resolution, rebuilt at most once per second"""
+    now = int(time.time())
+    if now != _TS_CACHE[0]:
+        current = datetime.fromtimestamp(now, timezone.utc).replace(tzinfo=None)
+        _TS_CACHE[:] = [now, current, current.isoformat() + "Z"]
+    return _TS_CACHE[1]
+
+def _now_iso() -> str:
+    """Return the cached UTC time as an ISO string, for fields that must be plain strings"""
+    _utcnow()
+    return _TS_CACHE[2]
+
 # Initialize Azure OpenAI client
+# Azure OpenAI settings are fixed for the worker's lifetime
+_OPENAI_API_KEY = os.getenv("AZURE_OPENAI_API_KEY")
+_OPENAI_ENDPOINT = os.getenv("AZURE_OPENAI_ENDPOINT")
+_OPENAI_DEPLOYMENT = os.getenv("AZURE_OPENAI_DEPLOYMENT_NAME", "gpt-4")
+
+# Optional Global Batch deployment for latency-tolerant bulk questionnaire runs; the Batch API
+# needs a newer API version than the real-time calls
+_OPENAI_BATCH_DEPLOYMENT = os.getenv("AZURE_OPENAI_BATCH_DEPLOYMENT_NAME")
+_OPENAI_BATCH_API_VERSION = "2024-10-21"
+
+# Rate-limited (429) and transient 5xx calls are retried by the SDK with exponential backoff,
+# honouring the service's Retry-After header
+_OPENAI_MAX_RETRIES = 3
+
+# One async client per worker so warm invocations reuse its HTTP connection pool and
+# model calls are awaited on the host event loop instead of blocking it
+_OPENAI_CLIENT = None
+
 def get_openai_client():
-    """Initialize Azure OpenAI client"""
-    try:
-        client = AzureOpenAI(
-            api_key=os.getenv("AZURE_OPENAI_API_KEY"),
-            api_version="2024-02-01",
-            azure_endpoint=os.getenv("AZURE_OPENAI_ENDPOINT")
+    """Return the shared async Azure OpenAI client, creating it on first use"""
+    global _OPENAI_CLIENT
+    if _OPENAI_CLIENT is None:
+        try:
+            # Imported on first use: the SDK is most of this module's import time, and the
+            # static and health endpoints never need it on a cold start
+            from openai import AsyncAzureOpenAI
+            _OPENAI_CLIENT = AsyncAzureOpenAI(
+                api_key=_OPENAI_API_KEY,
+                api_version="2024-02-01",
+                azure_endpoint=_OPENAI_ENDPOINT,
+                max_retries=_OPENAI_MAX_RETRIES
+            )
+        except Exception as e:
+            _log.error("Failed to initialize OpenAI client: %s", e)
+            return None
+    return _OPENAI_CLIENT
+
+_OPENAI_BATCH_CLIENT = None
+
+def get_openai_batch_client():
+    """Return the shared Azure OpenAI client for Batch API jobs, or None if batch is not configured"""
+    global _OPENAI_BATCH_CLIENT
+    if _OPENAI_BATCH_CLIENT is None and _OPENAI_BATCH_DEPLOYMENT:
+        try:
+            from openai import AsyncAzureOpenAI
+            _OPENAI_BATCH_CLIENT = AsyncAzureOpenAI(
+                api_key=_OPENAI_API_KEY,
+                api_version=_OPENAI_BATCH_API_VERSION,
+                azure_endpoint=_OPENAI_ENDPOINT,
+                max_retries=_OPENAI_MAX_RETRIES
+            )
+        except Exception as e:
+            _log.error("Failed to initialize OpenAI batch client: %s", e)
+            return None
+    return _OPENAI_BATCH_CLIENT
+
+# Supabase settings are fixed for the worker's lifetime; the request headers are built once
+_SUPABASE_URL = os.getenv("SUPABASE_URL")
+_SUPABASE_KEY = os.getenv("SUPABASE_ANON_KEY")
+_SUPABASE_HEADERS = {
+    "apikey": _SUPABASE_KEY or "",
+    "Authorization": f"Bearer {_SUPABASE_KEY}",
+    "Content-Type": "application/json",
+    "Accept-Encoding": "gzip"
+}
+
+# Shared Supabase HTTP/2 client: concurrent queries multiplex as streams over one pooled
+# connection. A client is bound to the event loop that created it, so it is rebuilt if the
+# running loop changes.
+_SUPABASE_CLIENT = None
+_SUPABASE_CLIENT_LOOP = None
+
+# HTTP/2 needs the h2 package from httpx[http2] in requirements.txt; an environment built
+# without it falls back to HTTP/1.1 instead of failing the first Supabase request
+_SUPABASE_HTTP2 = importlib.util.find_spec("h2") is not None
+if not _SUPABASE_HTTP2:
+    _log.warning("h2 is not installed; Supabase requests use HTTP/1.1. Install httpx[http2] from requirements.txt")
+
+def _close_stale_supabase_client(client: httpx.AsyncClient, loop: asyncio.AbstractEventLoop) -> None:
+    """Schedule aclose() for a client left behind by an earlier event loop, on that loop"""
+    # Its connections belong to that loop and can only be shut down there. A loop that is not
+    # running may never run again, so a queued aclose() would never execute; those sockets are
+    # released when the client is garbage collected instead.
+    if not loop.is_running():
+        _log.info("Dropping Supabase client from an event loop that is no longer running")
+        return
+    asyncio.run_coroutine_threadsafe(client.aclose(), loop)
+
+async def get_supabase_client() -> httpx.AsyncClient:
+    """Return the pooled Supabase client for the running event loop"""
+    global _SUPABASE_CLIENT, _SUPABASE_CLIENT_LOOP
+    loop = asyncio.get_running_loop()
+    if _SUPABASE_CLIENT is None or _SUPABASE_CLIENT.is_closed or _SUPABASE_CLIENT_LOOP is not loop:
+        stale_client, stale_loop = _SUPABASE_CLIENT, _SUPABASE_CLIENT_LOOP
+        _SUPABASE_CLIENT = httpx.AsyncClient(
+            http2=_SUPABASE_HTTP2,
+            limits=httpx.Limits(max_connections=100, max_keepalive_connections=20, keepalive_expiry=75),
+            timeout=httpx.Timeout(30.0)
         )
-        return client
-    except Exception as e:
-        logging.error(f"Failed to initialize OpenAI client: {str(e)}")
-        return None
+        _SUPABASE_CLIENT_LOOP = loop
+        if stale_client is not None and not stale_client.is_closed:
+            _close_stale_supabase_client(stale_client, stale_loop)
+    return _SUPABASE_CLIENT
+
+def _close_supabase_client():
+    """Close the shared Supabase client when the worker shuts down"""
+    loop = _SUPABASE_CLIENT_LOOP
+    if _SUPABASE_CLIENT is None or _SUPABASE_CLIENT.is_closed or loop is None:
+        return
+    if not loop.is_closed() and not loop.is_running():
+        loop.run_until_complete(_SUPABASE_CLIENT.aclose())
+
+atexit.register(_close_supabase_client)
 
 # Supabase API helper
-async def supabase_request(table: str, filters: Dict[str, str] = None, select: str = "*"):
+async def supabase_request(table: str, filters: Dict[str, str] = None, select: str = "*",
+                           order: str = None, limit: int = None):
     """Make async request to Supabase REST API"""
     try:
-        supabase_url = os.getenv("SUPABASE_URL")
-        supabase_key = os.getenv("SUPABASE_ANON_KEY")
-        
-        if not supabase_url or not supabase_key:
+        if not _SUPABASE_URL or not _SUPABASE_KEY:
             raise Exception("Supabase URL or API key not configured")
         
-        headers = {
-            "apikey": supabase_key,
-            "Authorization": f"Bearer {supabase_key}",
-            "Content-Type": "application/json"
-        }
-        
-        url = f"{supabase_url}/rest/v1/{table}"
+        url = f"{_SUPABASE_URL}/rest/v1/{table}"
         params = {"select": select}
         
         # Add filters
@@ -66,24 +181,61 @@ async def supabase_request(table: str, filters: Dict[str, str] = None, select: s
             for key, value in filters.items():
                 params[key] = value
         
-        async with aiohttp.ClientSession() as session:
-            async with session.get(url, headers=headers, params=params) as response:
-                if response.status == 200:
-                    return await response.json()
-                else:
-                    error_text = await response.text()
-                    raise Exception(f"Supabase API error {response.status}: {error_text}")
+        # Let Postgres sort and truncate so only the requested rows cross the network
+        if order:
+            params["order"] = order
+        if limit is not None:
+            params["limit"] = str(limit)
+        
+        client = await get_supabase_client()
+        response = await client.get(url, headers=_SUPABASE_HEADERS, params=params)
+        if response.status_code == 200:
+            return orjson.loads(response.content)
+        else:
+            raise Exception(f"Supabase API error {response.status_code}: {response.text}")
                     
     except Exception as e:
-        logging.error(f"Supabase API request failed: {str(e)}")
+        _log.error("Supabase API request failed: %s", e)
         raise
 
+# Monthly reporting data does not change intraday, so rows are reused for 15 minutes per (country, month)
+_METRICS_CACHE = TTLCache(maxsize=512, ttl=900)
+# (country, month) pairs that recently returned no rows; kept short so newly loaded months appear quickly
+_EMPTY_METRICS_CACHE = TTLCache(maxsize=256, ttl=300)
+# One lock per (country, month) so concurrent misses share a single Supabase query. Keys come
+# from the request path, so the locks are bounded and expire; a lock evicted while held only
+# costs a duplicate query, since every holder re-checks the metrics cache first
+_METRICS_LOCKS = TTLCache(maxsize=1024, ttl=120)
+
 async def fetch_country_metrics(country: str, month: str) -> List[Dict[str, Any]]:
     """Fetch country metrics from Supabase REST API"""
+    key = (country, month)
+    metrics = _METRICS_CACHE.get(key)
+    if metrics is not None:
+        return metrics
+    
+    lock = _METRICS_LOCKS.get(key)
+    if lock is None:
+        lock = _METRICS_LOCKS[key] = asyncio.Lock()
+    async with lock:
+        metrics = _METRICS_CACHE.get(key)
+        if metrics is None:
+            metrics = await _query_country_metrics(country, month)
+            if metrics:
+                _METRICS_CACHE[key] = metrics
+        return metrics
+
+async def _query_country_metrics(country: str, month: str) -> List[Dict[str, Any]]:
+    """Query country metrics from Supabase REST API, bypassing the metrics cache"""
     try:
-        logging.info(f"Fetching metrics for {country}, {month}")
+        if (country, month) in _EMPTY_METRICS_CACHE:
+            _log.info("No metrics for %s, %s (cached)", country, month)
+            return []
+        
+        _log.info("Fetching metrics for %s, %s", country, month)
         
         # Convert month to the format expected by Supabase (YYYY-MM-DD)
+        raw_month = month
         if isinstance(month, str):
             if len(month) == 7:  # Format: "2025-05"
                 month = f"{month}-01"
@@ -99,14 +251,154 @@ async def fetch_country_metrics(country: str, month: str) -> List[Dict[str, Any]
         
         metrics = await supabase_request("country_group_metrics", filters, select_columns)
         
-        logging.info(f"Retrieved {len(metrics)} metrics records")
+        _log.info("Retrieved %s metrics records", len(metrics))
+        if not metrics:
+            _EMPTY_METRICS_CACHE[(country, raw_month)] = True
         return metrics
         
     except Exception as e:
-        logging.error(f"Error fetching country metrics: {str(e)}")
+        _log.error("Error fetching country metrics: %s", e)
         raise
 
-def generate_ai_summary(country: str, month: str, group_type: str, metric: str, data: List[Dict[str, Any]]) -> str:
+# Upper bound on concurrent Supabase queries from a single fan-out
+_SUPABASE_FANOUT_LIMIT = 10
+
+async def fetch_many_country_metrics(pairs: List[Tuple[str, str]]) -> List[List[Dict[str, Any]]]:
+    """Fetch metrics for several (country, month) pairs concurrently, in input order"""
+    semaphore = asyncio.Semaphore(_SUPABASE_FANOUT_LIMIT)
+    
+    async def fetch_one(country: str, month: str) -> List[Dict[str, Any]]:
+        async with semaphore:
+            return await fetch_country_metrics(country, month)
+    
+    return await asyncio.gather(*(fetch_one(country, month) for country, month in pairs))
+
+def _portfolio_stats(metrics: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """Portfolio totals and IRR spread, accumulated in a single pass over the rows"""
+    total_contracts = total_nbv = total_delinquent = 0
+    irr_count = 0
+    irr_sum = 0.0
+    min_irr = max_irr = None
+    for m in metrics:
+        total_contracts += m.get('num_contracts') or 0
+        total_nbv += m.get('net_book_value') or 0
+        total_delinquent += m.get('delinquent_amount') or 0
+        irr = m.get('irr_nominal')
+        if irr is not None:
+            irr_count += 1
+            irr_sum += irr
+            if min_irr is None or irr < min_irr:
+                min_irr = irr
+            if max_irr is None or irr > max_irr:
+                max_irr = irr
+    
+    return {
+        "total_contracts": total_contracts,
+        "total_nbv": total_nbv,
+        "total_delinquent": total_delinquent,
+        "delinquency_rate": (total_delinquent / total_nbv * 100) if total_nbv > 0 else 0,
+        "irr_count": irr_count,
+        "avg_irr": irr_sum / irr_count if irr_count else 0,
+        "min_irr": min_irr if irr_count else 0,
+        "max_irr": max_irr if irr_count else 0
+    }
+
+def _segment_figures(m: Dict[str, Any]) -> Tuple[str, int, float, float]:
+    """Name, contracts, IRR in percent and NBV in millions for display, missing values as zero"""
+    return (
+        m.get('group_name', 'Unknown'),
+        m.get('num_contracts') or 0,
+        (m.get('irr_nominal') or 0) * 100,
+        (m.get('net_book_value') or 0) / 1000000
+    )
+
+# Columns repeated on every metrics row; they are stated once in the prompt header instead
+_PROMPT_ROW_CONSTANTS = ("country_code", "reporting_month", "currency")
+# Additive columns that can be summed when small groups are folded into one row
+_PROMPT_SUM_COLUMNS = ("num_contracts", "nbv_local_cms", "gross_exposure", "net_book_value", "delinquent_amount", "downpayment_amount")
+# Groups beyond this many (by net book value) are folded into a single "Other" row
+_PROMPT_MAX_GROUPS = 40
+
+def _prompt_row(m: Dict[str, Any]) -> Dict[str, Any]:
+    """Copy of a metrics row without the per-row constants and with floats rounded"""
+    return {
+        key: round(value, 4) if isinstance(value, float) else value
+        for key, value in m.items()
+        if key not in _PROMPT_ROW_CONSTANTS
+    }
+
+def _compact_metrics_for_prompt(metrics: List[Dict[str, Any]]) -> Tuple[List[str], List[Dict[str, Any]]]:
+    """Shrink metrics rows for the prompt: drop per-row constants, round floats, fold the tail"""
+    currencies = sorted({m.get('currency') for m in metrics if m.get('currency')})
+    rows = [_prompt_row(m) for m in metrics]
+    
+    if len(rows) > _PROMPT_MAX_GROUPS:
+        rows.sort(key=lambda r: r.get('net_book_value') or 0, reverse=True)
+        tail = rows[_PROMPT_MAX_GROUPS - 1:]
+        other = {"group_type": "Other", "group_name": f"{len(tail)} smaller groups"}
+        for column in _PROMPT_SUM_COLUMNS:
+            other[column] = round(sum(r.get(column) or 0 for r in tail), 4)
+        rows = rows[:_PROMPT_MAX_GROUPS - 1] + [other]
+    
+    return currencies, rows
+
+# Segments quoted verbatim in the AI summary prompt
+_SUMMARY_TOP_SEGMENTS = 10
+_SUMMARY_BOTTOM_SEGMENTS = 5
+
+# Analysis focus per summary metric
+_SUMMARY_METRIC_GUIDANCE = {
+    "IRR (%)": "Focus on profitability analysis, spread between segments, and risk-adjusted returns. Identify highest and lowest performing segments.",
+    "NBV (€)": "Analyze portfolio concentration, exposure distribution, and capital allocation across segments. Highlight concentration risks.",
+    "Delinquency (%)": "Examine credit risk patterns, problem segments, and portfolio quality indicators. Flag any concerning trends.",
+    "Contracts (#)": "Review volume distribution, operational efficiency, and business scale across segments. Identify growth patterns."
+}
+
+# Role, output structure and formatting rules for the AI summary. Sent as the system message
+# and kept free of request data so every call shares the same prompt prefix.
+_SUMMARY_SYSTEM_PROMPT = """You are a Senior Financial Analyst providing executive-level insights on portfolio performance data.
+
+For the analysis request in the user message, provide a comprehensive executive summary with the following structure and formatting:
+
+**1. Key Findings**
+• [Finding 1 with specific data points]
+• [Finding 2 with specific data points]  
+• [Finding 3 with specific data points]
+
+**2. Performance Analysis**
+• **Segment Performance:**
+- [Analysis of top performers with specific IRR/values]
+- [Analysis of middle performers]
+- [Analysis of underperformers]
+• **Portfolio Concentration:**
+- [Analysis of largest segments and their impact]
+- [Risk-return trade-offs]
+
+**3. Risk Assessment**
+• **Primary Risks:**
+- [Risk 1 with quantification]
+- [Risk 2 with quantification]
+• **Portfolio Balance:**
+- [Assessment of diversification and concentration]
+
+**4. Strategic Recommendations**
+• [Recommendation 1 with specific action items]
+• [Recommendation 2 with specific action items]
+• [Recommendation 3 with specific action items]
+• [Recommendation 4 with specific action items]
+
+FORMATTING REQUIREMENTS:
+- Use **bold** for section headers (1., 2., 3., 4.)
+- Use **bold** for subsection headers (Segment Performance:, Primary Risks:, etc.)
+- Use bullet points (•) for main points
+- Use sub-bullets with dashes (-) for detailed breakdowns
+- Include specific numbers, percentages, and monetary values
+- Keep each bullet point concise but informative
+- Total length: 400-500 words
+- Professional, executive-level tone
+"""
+
+async def generate_ai_summary(country: str, month: str, group_type: str, metric: str, data: List[Dict[str, Any]]) -> str:
     """Generate AI-powered summary analysis based on filtered data"""
     try:
         client = get_openai_client()
@@ -115,15 +407,13 @@ def generate_ai_summary(country: str, month: str, group_type: str, metric: str,
         
         # Calculate key statistics from the filtered data
         total_records = len(data)
-        total_contracts = sum(item.get('num_contracts', 0) or 0 for item in data)
-        total_nbv = sum(item.get('net_book_value', 0) or 0 for item in data)
-        total_delinquent = sum(item.get('delinquent_amount', 0) or 0 for item in data)
-        
-        # Calculate IRR statistics if available
-        irr_values = [item.get('irr_nominal', 0) for item in data if item.get('irr_nominal') is not None]
-        avg_irr = sum(irr_values) / len(irr_values) if irr_values else 0
-        min_irr = min(irr_values) if irr_values else 0
-        max_irr = max(irr_values) if irr_values else 0
+        stats = _portfolio_stats(data)
+        total_contracts = stats["total_contracts"]
+        total_nbv = stats["total_nbv"]
+        total_delinquent = stats["total_delinquent"]
+        avg_irr = stats["avg_irr"]
+        min_irr = stats["min_irr"]
+        max_irr = stats["max_irr"]
         
         # Get group names for context
         group_names = [item.get('group_name', 'Unknown') for item in data]
@@ -141,197 +431,111 @@ def generate_ai_summary(country: str, month: str, group_type: str, metric: str,
                 "total_contracts": total_contracts,
                 "total_net_book_value": total_nbv,
                 "total_delinquent_amount": total_delinquent,
-                "delinquency_rate_pct": (total_delinquent / total_nbv * 100) if total_nbv > 0 else 0
+                "delinquency_rate_pct": stats["delinquency_rate"]
             },
             "irr_analysis": {
                 "average_irr": avg_irr,
                 "min_irr": min_irr,
                 "max_irr": max_irr,
-                "irr_range": max_irr - min_irr if irr_values else 0
+                "irr_range": max_irr - min_irr
             },
             "segments_analyzed": group_names
         }
         
-        # Create metric-specific analysis prompt
-        metric_guidance = {
-            "IRR (%)": "Focus on profitability analysis, spread between segments, and risk-adjusted returns. Identify highest and lowest performing segments.",
-            "NBV (€)": "Analyze portfolio concentration, exposure distribution, and capital allocation across segments. Highlight concentration risks.",
-            "Delinquency (%)": "Examine credit risk patterns, problem segments, and portfolio quality indicators. Flag any concerning trends.",
-            "Contracts (#)": "Review volume distribution, operational efficiency, and business scale across segments. Identify growth patterns."
+        # The full rows are summarized above; only the segments worth calling out go in verbatim
+        segment_digest = {
+            "top_by_nbv": [
+                _prompt_row(m) for m in heapq.nlargest(_SUMMARY_TOP_SEGMENTS, data, key=lambda m: m.get('net_book_value') or 0)
+            ],
+            "bottom_by_irr": [
+                _prompt_row(m) for m in heapq.nsmallest(
+                    _SUMMARY_BOTTOM_SEGMENTS,
+                    (m for m in data if m.get('irr_nominal') is not None),
+                    key=lambda m: m['irr_nominal']
+                )
+            ]
         }
 
-        prompt = f"""
-            You are a Senior Financial Analyst providing executive-level insights on portfolio performance data. 
-
-            ANALYSIS REQUEST:
-            - Country: {country}
-            - Period: {month}
-            - Focus Area: {group_type} segments
-            - Key Metric: {metric}
-            - Data Points: {total_records} segments
-
-            PORTFOLIO SUMMARY:
-            {json.dumps(context_stats, indent=2)}
-
-            DETAILED SEGMENT DATA:
-            {json.dumps(data, indent=2)}
-
-            ANALYSIS GUIDANCE:
-            {metric_guidance.get(metric, "Provide comprehensive analysis of the selected metric across all segments.")}
-
-            Please provide a comprehensive executive summary with the following structure and formatting:
-
-            **1. Key Findings**
-            • [Finding 1 with specific data points]
-            • [Finding 2 with specific data points]  
-            • [Finding 3 with specific data points]
-
-            **2. Performance Analysis**
-            • **Segment Performance:**
-            - [Analysis of top performers with specific IRR/values]
-            - [Analysis of middle performers]
-            - [Analysis of underperformers]
-            • **Portfolio Concentration:**
-            - [Analysis of largest segments and their impact]
-            - [Risk-return trade-offs]
-
-            **3. Risk Assessment**
-            • **Primary Risks:**
-            - [Risk 1 with quantification]
-            - [Risk 2 with quantification]
-            • **Portfolio Balance:**
-            - [Assessment of diversification and concentration]
-
-            **4. Strategic Recommendations**
-            • [Recommendation 1 with specific action items]
-            • [Recommendation 2 with specific action items]
-            • [Recommendation 3 with specific action items]
-            • [Recommendation 4 with specific action items]
-
-            FORMATTING REQUIREMENTS:
-            - Use **bold** for section headers (1., 2., 3., 4.)
-            - Use **bold** for subsection headers (Segment Performance:, Primary Risks:, etc.)
-            - Use bullet points (•) for main points
-            - Use sub-bullets with dashes (-) for detailed breakdowns
-            - Include specific numbers, percentages, and monetary values
-            - Keep each bullet point concise but informative
-            - Total length: 400-500 words
-            - Professional, executive-level tone
-            """
-        
-        response = client.chat.completions.create(
-            model=os.getenv("AZURE_OPENAI_DEPLOYMENT_NAME", "gpt-4"),
-            messages=[{"role": "user", "content": prompt}],
+        prompt = f"""ANALYSIS REQUEST:
+- Country: {country}
+- Period: {month}
+- Focus Area: {group_type} segments
+- Key Metric: {metric}
+- Data Points: {total_records} segments
+
+PORTFOLIO SUMMARY:
+{orjson.dumps(context_stats).decode()}
+
+KEY SEGMENTS (largest by NBV, weakest by IRR):
+{orjson.dumps(segment_digest).decode()}
+
+ANALYSIS GUIDANCE:
+{_SUMMARY_METRIC_GUIDANCE.get(metric, "Provide comprehensive analysis of the selected metric across all segments.")}
+"""
+        
+        return await cached_completion(
+            client,
+            model=_OPENAI_DEPLOYMENT,
+            messages=[
+                {"role": "system", "content": _SUMMARY_SYSTEM_PROMPT},
+                {"role": "user", "content": prompt}
+            ],
             temperature=0.3,
             max_tokens=1000
         )
         
-        return response.choices[0].message.content
-        
     except Exception as e:
-        logging.error(f"Failed to generate AI summary: {str(e)}")
+        _log.error("Failed to generate AI summary: %s", e)
         raise
 
-def generate_chat_response(question: str, country: str, month: str, context: str, metrics_data: List[Dict[str, Any]]) -> Dict[str, Any]:
-    """Generate AI-powered chat response with structured formatting"""
-    try:
-        client = get_openai_client()
-        if not client:
-            raise Exception("OpenAI client not available")
-        
-        # Calculate key statistics from the metrics data
-        total_records = len(metrics_data)
-        total_contracts = sum(item.get('num_contracts', 0) or 0 for item in metrics_data)
-        total_nbv = sum(item.get('net_book_value', 0) or 0 for item in metrics_data)
-        total_delinquent = sum(item.get('delinquent_amount', 0) or 0 for item in metrics_data)
-        
-        # Calculate IRR statistics
-        irr_values = [item.get('irr_nominal', 0) for item in metrics_data if item.get('irr_nominal') is not None]
-        avg_irr = sum(irr_values) / len(irr_values) if irr_values else 0
-        
-        # Get group types and names
-        group_types = list(set(item.get('group_type', 'Unknown') for item in metrics_data))
-        
-        # Find specific segments mentioned in data for detailed analysis
-        segment_details = {}
-        for item in metrics_data:
-            group_name = item.get('group_name', 'Unknown')
-            if group_name not in segment_details:
-                segment_details[group_name] = {
-                    'contracts': item.get('num_contracts', 0),
-                    'irr': item.get('irr_nominal', 0) * 100 if item.get('irr_nominal') else 0,
-                    'nbv': item.get('net_book_value', 0),
-                    'delinquent': item.get('delinquent_amount', 0),
-                    'group_type': item.get('group_type', 'Unknown')
-                }
-        
-        # Build comprehensive context for the AI
-        data_context = f"""
-        PORTFOLIO OVERVIEW FOR {country.upper()} - {month}:
-        • Total Portfolio: {total_contracts:,} contracts, €{total_nbv/1000000:.1f}M NBV
-        • Average IRR: {avg_irr*100:.2f}%
-        • Total Delinquent: €{total_delinquent/1000:.0f}K
-        • Delinquency Rate: {(total_delinquent/total_nbv*100) if total_nbv > 0 else 0:.2f}%
-        • Available Group Types: {', '.join(group_types)}
-        • Total Data Points: {total_records} segments
-
-        DETAILED SEGMENT BREAKDOWN:
-        """
-        
-        # Add top segments by volume for context
-        sorted_segments = sorted(segment_details.items(), key=lambda x: x[1]['contracts'], reverse=True)
-        for name, details in sorted_segments[:10]:  # Top 10 segments
-            delinq_rate = (details['delinquent'] / details['nbv'] * 100) if details['nbv'] > 0 else 0
-            data_context += f"\n• {name} ({details['group_type']}): {details['contracts']:,} contracts, {details['irr']:.2f}% IRR, €{details['nbv']/1000000:.1f}M NBV, {delinq_rate:.2f}% delinq"
-
-        # Create the system prompt that requests structured output
-        system_prompt = f"""
+# Structured-output instructions for chat; only the caller-supplied context is appended
+_CHAT_SYSTEM_PROMPT = """
 You are a Senior Financial Data Analyst for Daimler Truck Financial Services (DTFS). 
 
 CRITICAL: You must respond ONLY with valid JSON in the exact format specified below. Do not include any text before or after the JSON.
 
 Required JSON format:
-{{
+{
     "summary": "Brief 1-2 sentence summary of your main finding",
     "sections": [
-        {{
+        {
             "title": "Section Title",
             "content": [
-                {{
+                {
                     "type": "paragraph",
                     "text": "Your explanation text here"
-                }},
-                {{
+                },
+                {
                     "type": "bullet_list", 
                     "items": [
-                        {{"text": "Bullet point 1", "highlight": false}},
-                        {{"text": "Important point", "highlight": true}}
+                        {"text": "Bullet point 1", "highlight": false},
+                        {"text": "Important point", "highlight": true}
                     ]
-                }},
-                {{
+                },
+                {
                     "type": "table",
                     "headers": ["Segment", "IRR", "NBV", "Delinquency"],
                     "rows": [
                         ["MB/CV", "4.86%", "€400.8M", "0.07%"],
                         ["BFLEA", "4.84%", "€209.2M", "0.25%"]
                     ]
-                }},
-                {{
+                },
+                {
                     "type": "metric",
                     "label": "Key Metric Name",
                     "value": "4.86%",
                     "trend": "positive"
-                }}
+                }
             ]
-        }}
+        }
     ],
     "recommendations": [
-        {{"action": "Specific actionable recommendation", "priority": "high"}}
+        {"action": "Specific actionable recommendation", "priority": "high"}
     ]
-}}
+}
 
 IMPORTANT RULES:
-- Start response with {{ and end with }}
+- Start response with { and end with }
 - Use only the content types: paragraph, bullet_list, table, metric
 - For trends use: positive, negative, or neutral
 - For priorities use: high, medium, or low
@@ -339,8 +543,83 @@ IMPORTANT RULES:
 - Do not use markdown formatting in text fields
 - Ensure valid JSON syntax
 
-Current context: {context}
-"""
+Current context: """
+
+def _parse_chat_reply(ai_response_text: str) -> Dict[str, Any]:
+    """Parse a structured chat reply; raises ValueError unless it is a JSON object with sections"""
+    # JSON mode normally returns a bare object, so parse it as-is first
+    try:
+        structured_response = orjson.loads(ai_response_text)
+    except orjson.JSONDecodeError:
+        # Otherwise take the outermost braces, which also skips markdown fences
+        json_start = ai_response_text.find('{')
+        json_end = ai_response_text.rfind('}') + 1
+        if json_start < 0 or json_end <= json_start:
+            raise ValueError("No valid JSON found")
+        structured_response = orjson.loads(ai_response_text[json_start:json_end])
+    
+    # Validate the structure
+    if isinstance(structured_response, dict) and 'sections' in structured_response:
+        return structured_response
+    raise ValueError("Invalid response structure")
+
+def _is_chat_reply(ai_response_text: str) -> bool:
+    """Whether a chat completion parses into a structured reply and is worth caching"""
+    try:
+        _parse_chat_reply(ai_response_text)
+        return True
+    except ValueError:
+        return False
+
+async def generate_chat_response(question: str, country: str, month: str, context: str, metrics_data: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """Generate AI-powered chat response with structured formatting"""
+    try:
+        client = get_openai_client()
+        if not client:
+            raise Exception("OpenAI client not available")
+        
+        # Calculate key statistics from the metrics data
+        total_records = len(metrics_data)
+        stats = _portfolio_stats(metrics_data)
+        total_contracts = stats["total_contracts"]
+        total_nbv = stats["total_nbv"]
+        total_delinquent = stats["total_delinquent"]
+        avg_irr = stats["avg_irr"]
+        
+        # Get group types and names
+        group_types = list({item.get('group_type', 'Unknown') for item in metrics_data})
+        
+        # First row per segment name; only the ten largest by contracts are detailed below
+        first_rows = {}
+        for item in metrics_data:
+            first_rows.setdefault(item.get('group_name', 'Unknown'), item)
+        top_segments = heapq.nlargest(10, first_rows.items(), key=lambda x: x[1].get('num_contracts') or 0)
+        
+        # Build comprehensive context for the AI
+        data_context = f"""
+        PORTFOLIO OVERVIEW FOR {country.upper()} - {month}:
+        • Total Portfolio: {total_contracts:,} contracts, €{total_nbv/1000000:.1f}M NBV
+        • Average IRR: {avg_irr*100:.2f}%
+        • Total Delinquent: €{total_delinquent/1000:.0f}K
+        • Delinquency Rate: {(total_delinquent/total_nbv*100) if total_nbv > 0 else 0:.2f}%
+        • Available Group Types: {', '.join(group_types)}
+        • Total Data Points: {total_records} segments
+
+        DETAILED SEGMENT BREAKDOWN:
+        """
+        
+        # Add top segments by volume for context
+        segment_lines = []
+        for name, item in top_segments:
+            contracts = item.get('num_contracts') or 0
+            irr = (item.get('irr_nominal') or 0) * 100
+            nbv = item.get('net_book_value') or 0
+            delinq_rate = ((item.get('delinquent_amount') or 0) / nbv * 100) if nbv > 0 else 0
+            segment_lines.append(f"\n• {name} ({item.get('group_type', 'Unknown')}): {contracts:,} contracts, {irr:.2f}% IRR, €{nbv/1000000:.1f}M NBV, {delinq_rate:.2f}% delinq")
+        data_context += "".join(segment_lines)
+
+        # Create the system prompt that requests structured output
+        system_prompt = f"{_CHAT_SYSTEM_PROMPT}{context}\n"
 
         # Create the user prompt with data and question
         user_prompt = f"""
@@ -357,51 +636,26 @@ Provide your analysis in the required JSON format. Focus on:
 Remember: Respond ONLY with valid JSON, no additional text."""
 
         # Call Azure OpenAI with more specific parameters for JSON output
-        response = client.chat.completions.create(
-            model=os.getenv("AZURE_OPENAI_DEPLOYMENT_NAME", "gpt-4"),
+        ai_response_text = await cached_completion(
+            client,
+            model=_OPENAI_DEPLOYMENT,
             messages=[
                 {"role": "system", "content": system_prompt},
                 {"role": "user", "content": user_prompt}
             ],
             temperature=0.1,  # Lower temperature for more consistent JSON output
+            validate=_is_chat_reply,  # Malformed replies get the fallback below and are not cached
             max_tokens=1500,
             response_format={"type": "json_object"}  # Force JSON output if supported
         )
         
-        ai_response_text = response.choices[0].message.content
-        
         # Try to parse as JSON with better error handling
         try:
-            # Clean the response text
-            cleaned_response = ai_response_text.strip()
-            
-            # Remove any potential markdown code blocks
-            if cleaned_response.startswith('```json'):
-                cleaned_response = cleaned_response[7:]
-            if cleaned_response.startswith('```'):
-                cleaned_response = cleaned_response[3:]
-            if cleaned_response.endswith('```'):
-                cleaned_response = cleaned_response[:-3]
-            
-            # Find JSON boundaries more reliably
-            json_start = cleaned_response.find('{')
-            json_end = cleaned_response.rfind('}') + 1
-            
-            if json_start >= 0 and json_end > json_start:
-                json_str = cleaned_response[json_start:json_end]
-                structured_response = json.loads(json_str)
+            return _parse_chat_reply(ai_response_text)
                 
-                # Validate the structure
-                if isinstance(structured_response, dict) and 'sections' in structured_response:
-                    return structured_response
-                else:
-                    raise ValueError("Invalid response structure")
-            else:
-                raise ValueError("No valid JSON found")
-                
-        except (json.JSONDecodeError, ValueError) as e:
-            logging.warning(f"Failed to parse JSON response: {str(e)}")
-            logging.warning(f"Raw response: {ai_response_text[:500]}...")
+        except ValueError as e:
+            _log.warning("Failed to parse JSON response: %s", e)
+            _log.warning("Raw response: %s...", ai_response_text[:500])
             
             # Fallback: create a structured response from the text
             return {
@@ -426,10 +680,10 @@ Remember: Respond ONLY with valid JSON, no additional text."""
             }
         
     except Exception as e:
-        logging.error(f"Failed to generate chat response: {str(e)}")
+        _log.error("Failed to generate chat response: %s", e)
         raise
 
-def generate_powerpoint_content_react(question: str, country: str, month: str, metrics_data: List[Dict[str, Any]]) -> Dict[str, Any]:
+async def generate_powerpoint_content_react(question: str, country: str, month: str, metrics_data: List[Dict[str, Any]]) -> Dict[str, Any]:
     """Generate PowerPoint content using ReAct approach"""
     
     client = get_openai_client()
@@ -452,8 +706,9 @@ def generate_powerpoint_content_react(question: str, country: str, month: str, m
     Available data: {len(metrics_data)} portfolio segments with IRR, NBV, contracts, and delinquency data.
     """
     
-    thinking_response = client.chat.completions.create(
-        model=os.getenv("AZURE_OPENAI_DEPLOYMENT_NAME", "gpt-4"),
+    thinking_content = await cached_completion(
+        client,
+        model=_OPENAI_DEPLOYMENT,
         messages=[{"role": "user", "content": thinking_prompt}],
         temperature=0.3,
         max_tokens=500
@@ -461,9 +716,9 @@ def generate_powerpoint_content_react(question: str, country: str, month: str, m
     
     thinking_step = {
         "type": "thinking",
-        "content": thinking_response.choices[0].message.content,
+        "content": thinking_content,
         "status": "completed",
-        "timestamp": datetime.utcnow().isoformat()
+        "timestamp": _utcnow()
     }
     steps.append(thinking_step)
     
@@ -473,28 +728,27 @@ def generate_powerpoint_content_react(question: str, country: str, month: str, m
         "content": f"Analyzing portfolio data for {country} - {month}. Processing {len(metrics_data)} segments.",
         "tool_used": "data_analysis",
         "status": "in_progress",
-        "timestamp": datetime.utcnow().isoformat()
+        "timestamp": _utcnow()
     }
     steps.append(action_step)
     
     # Calculate key statistics
-    total_contracts = sum(item.get('num_contracts', 0) or 0 for item in metrics_data)
-    total_nbv = sum(item.get('net_book_value', 0) or 0 for item in metrics_data)
-    total_delinquent = sum(item.get('delinquent_amount', 0) or 0 for item in metrics_data)
-    
-    # IRR analysis
-    irr_values = [item.get('irr_nominal', 0) for item in metrics_data if item.get('irr_nominal') is not None]
-    avg_irr = sum(irr_values) / len(irr_values) if irr_values else 0
+    stats = _portfolio_stats(metrics_data)
+    total_contracts = stats["total_contracts"]
+    total_nbv = stats["total_nbv"]
+    total_delinquent = stats["total_delinquent"]
+    avg_irr = stats["avg_irr"]
     
-    # Top and bottom performers
-    sorted_by_irr = sorted(metrics_data, key=lambda x: x.get('irr_nominal', 0) or 0, reverse=True)
+    # Orderings are computed once here and reused for the performer picks and the slides
+    sorted_by_irr = sorted(metrics_data, key=lambda x: x.get('irr_nominal') or 0, reverse=True)
+    top_by_nbv = heapq.nlargest(10, metrics_data, key=lambda x: x.get('net_book_value') or 0)
     top_performer = sorted_by_irr[0] if sorted_by_irr else None
     bottom_performer = sorted_by_irr[-1] if sorted_by_irr else None
     
     data_insights = {
         "total_contracts": total_contracts,
         "total_nbv_millions": total_nbv / 1000000,
-        "delinquency_rate": (total_delinquent / total_nbv * 100) if total_nbv > 0 else 0,
+        "delinquency_rate": stats["delinquency_rate"],
         "average_irr": avg_irr * 100,
         "top_performer": top_performer,
         "bottom_performer": bottom_performer,
@@ -511,8 +765,8 @@ def generate_powerpoint_content_react(question: str, country: str, month: str, m
     • Portfolio size: {total_contracts:,} contracts worth €{total_nbv/1000000:.1f}M
     • Average IRR: {avg_irr*100:.2f}%
     • Delinquency rate: {(total_delinquent/total_nbv*100) if total_nbv > 0 else 0:.2f}%
-    • Best performing segment: {top_performer.get('group_name', 'N/A') if top_performer else 'N/A'} ({(top_performer.get('irr_nominal', 0) * 100):.2f}% IRR)
-    • Underperforming segment: {bottom_performer.get('group_name', 'N/A') if bottom_performer else 'N/A'} ({(bottom_performer.get('irr_nominal', 0) * 100):.2f}% IRR)
+    • Best performing segment: {top_performer.get('group_name', 'N/A') if top_performer else 'N/A'} ({((top_performer.get('irr_nominal') or 0) * 100):.2f}% IRR)
+    • Underperforming segment: {bottom_performer.get('group_name', 'N/A') if bottom_performer else 'N/A'} ({((bottom_performer.get('irr_nominal') or 0) * 100):.2f}% IRR)
     
     This data tells a clear story about portfolio performance and risk distribution.
     """
@@ -521,7 +775,7 @@ def generate_powerpoint_content_react(question: str, country: str, month: str, m
         "type": "observation",
         "content": observation_content,
         "status": "completed",
-        "timestamp": datetime.utcnow().isoformat()
+        "timestamp": _utcnow()
     }
     steps.append(observation_step)
     
@@ -542,7 +796,7 @@ def generate_powerpoint_content_react(question: str, country: str, month: str, m
         "type": "thinking", 
         "content": structure_thinking,
         "status": "completed",
-        "timestamp": datetime.utcnow().isoformat()
+        "timestamp": _utcnow()
     }
     steps.append(structure_step)
     
@@ -552,12 +806,12 @@ def generate_powerpoint_content_react(question: str, country: str, month: str, m
         "content": "Generating PowerPoint slide content with charts and key messages",
         "tool_used": "content_generation",
         "status": "in_progress", 
-        "timestamp": datetime.utcnow().isoformat()
+        "timestamp": _utcnow()
     }
     steps.append(ppt_generation_step)
     
     # Generate slide content
-    slide_content = generate_slide_content(country, month, data_insights, metrics_data, client)
+    slide_content = generate_slide_content(country, month, data_insights, sorted_by_irr, top_by_nbv)
     
     ppt_generation_step["status"] = "completed"
     ppt_generation_step["result"] = f"Generated {len(slide_content)} slides with executive summary, performance analysis, and recommendations"
@@ -567,7 +821,7 @@ def generate_powerpoint_content_react(question: str, country: str, month: str, m
         "type": "final_answer",
         "content": "PowerPoint presentation content generated successfully. Ready for download/review.",
         "status": "completed",
-        "timestamp": datetime.utcnow().isoformat(),
+        "timestamp": _utcnow(),
         "deliverable": {
             "presentation_title": f"{country} Portfolio Performance - {month}",
             "slides": slide_content,
@@ -584,8 +838,8 @@ def generate_powerpoint_content_react(question: str, country: str, month: str, m
         "final_deliverable": slide_content
     }
 
-def generate_slide_content(country: str, month: str, insights: Dict, metrics_data: List[Dict], client) -> List[Dict]:
-    """Generate actual slide content"""
+def generate_slide_content(country: str, month: str, insights: Dict, sorted_by_irr: List[Dict], top_by_nbv: List[Dict]) -> List[Dict]:
+    """Generate actual slide content from segments pre-sorted by IRR (descending) and the top 10 by NBV"""
     
     slides = []
     
@@ -632,23 +886,23 @@ def generate_slide_content(country: str, month: str, insights: Dict, metrics_dat
                 "title": "Portfolio by Segment (NBV)",
                 "data": [
                     {
-                        "segment": item.get('group_name', 'Unknown'),
-                        "nbv": item.get('net_book_value', 0) / 1000000,
-                        "contracts": item.get('num_contracts', 0)
+                        "segment": name,
+                        "nbv": nbv_m,
+                        "contracts": contracts
                     }
-                    for item in sorted(metrics_data, key=lambda x: x.get('net_book_value', 0), reverse=True)[:10]
+                    for name, contracts, _, nbv_m in map(_segment_figures, top_by_nbv)
                 ]
             },
             "summary_table": {
                 "headers": ["Segment", "Contracts", "NBV (€M)", "IRR (%)"],
                 "rows": [
                     [
-                        item.get('group_name', 'Unknown'),
-                        f"{item.get('num_contracts', 0):,}",
-                        f"€{(item.get('net_book_value', 0) / 1000000):.1f}M",
-                        f"{(item.get('irr_nominal', 0) * 100):.2f}%"
+                        name,
+                        f"{contracts:,}",
+                        f"€{nbv_m:.1f}M",
+                        f"{irr_pct:.2f}%"
                     ]
-                    for item in sorted(metrics_data, key=lambda x: x.get('net_book_value', 0), reverse=True)[:5]
+                    for name, contracts, irr_pct, nbv_m in map(_segment_figures, top_by_nbv[:5])
                 ]
             }
         }
@@ -662,19 +916,19 @@ def generate_slide_content(country: str, month: str, insights: Dict, metrics_dat
         "content": {
             "top_performers": [
                 {
-                    "name": item.get('group_name', 'Unknown'),
-                    "irr": f"{(item.get('irr_nominal', 0) * 100):.2f}%",
-                    "nbv": f"€{(item.get('net_book_value', 0) / 1000000):.1f}M"
+                    "name": name,
+                    "irr": f"{irr_pct:.2f}%",
+                    "nbv": f"€{nbv_m:.1f}M"
                 }
-                for item in sorted(metrics_data, key=lambda x: x.get('irr_nominal', 0) or 0, reverse=True)[:3]
+                for name, _, irr_pct, nbv_m in map(_segment_figures, sorted_by_irr[:3])
             ],
             "underperformers": [
                 {
-                    "name": item.get('group_name', 'Unknown'), 
-                    "irr": f"{(item.get('irr_nominal', 0) * 100):.2f}%",
-                    "issues": "Low profitability" if (item.get('irr_nominal', 0) * 100) < 3 else "Review required"
+                    "name": name, 
+                    "irr": f"{irr_pct:.2f}%",
+                    "issues": "Low profitability" if irr_pct < 3 else "Review required"
                 }
-                for item in sorted(metrics_data, key=lambda x: x.get('irr_nominal', 0) or 0)[:3]
+                for name, _, irr_pct, _ in map(_segment_figures, sorted_by_irr[:-4:-1])
             ]
         }
     })
@@ -700,33 +954,14 @@ def generate_slide_content(country: str, month: str, insights: Dict, metrics_dat
     
     return slides
 
-def generate_ai_questions(country: str, month: str, metrics: List[Dict[str, Any]]) -> List[Question]:
-    """Generate AI-powered questions based on country metrics"""
-    try:
-        client = get_openai_client()
-        if not client:
-            raise Exception("OpenAI client not available")
-        
-        # Calculate summary statistics for better context
-        total_contracts = sum(m.get('num_contracts', 0) or 0 for m in metrics)
-        total_nbv = sum(m.get('net_book_value', 0) or 0 for m in metrics)
-        total_delinquent = sum(m.get('delinquent_amount', 0) or 0 for m in metrics)
-        
-        summary_stats = {
-            "total_contracts": total_contracts,
-            "total_net_book_value": total_nbv,
-            "total_delinquent_amount": total_delinquent,
-            "delinquency_rate": (total_delinquent / total_nbv * 100) if total_nbv > 0 else 0
-        }
-        
-        prompt = f"""
-You are a Data Quality Assistant for financial portfolio management. Analyze the following financial metrics for {country} for the month {month} and generate 3-5 specific, insightful questions for the country manager.
+# Completions run at low temperature on the same inputs within a reporting cycle, so parsed
+# question lists are reused for an hour keyed by the exact request inputs
+_QUESTION_TEMPERATURE = 0.2
+_QUESTION_CACHE = TTLCache(maxsize=512, ttl=3600)
 
-SUMMARY STATISTICS:
-{json.dumps(summary_stats, indent=2)}
-
-DETAILED METRICS BY GROUP:
-{json.dumps(metrics, indent=2)}
+# Static instructions and schema for question generation. Kept free of interpolated values
+# so every request shares the same prompt prefix and can hit Azure OpenAI prompt caching.
+_QUESTION_SYSTEM_PROMPT = """You are a Data Quality Assistant for financial portfolio management. Analyze the financial metrics for the country and month given by the user and generate 3-5 specific, insightful questions for the country manager.
 
 Focus on:
 1. Unusual trends or anomalies in contract numbers, NBV, or delinquency rates
@@ -740,93 +975,244 @@ Generate questions that are:
 - Prioritized by business impact
 - Clear and professional
 
-Return a JSON array of objects with this exact structure:
-[
-  {{
-    "id": "q1_category_topic",
-    "category": "Portfolio Performance|Risk Management|Data Quality|Operational",
-    "question_text": "Your specific question here...",
-    "priority": "low|high|critical",
-    "expected_response_type": "text",
-    "context": "Brief explanation of why this question is important",
-    "related_data": {{"key": "value pairs of relevant metrics"}}
-  }}
-]
+Return a JSON object with a "questions" array in this exact structure:
+{
+  "questions": [
+    {
+      "id": "q1_category_topic",
+      "category": "Portfolio Performance|Risk Management|Data Quality|Operational",
+      "question_text": "Your specific question here...",
+      "priority": "low|high|critical",
+      "expected_response_type": "text",
+      "context": "Brief explanation of why this question is important",
+      "related_data": {"key": "value pairs of relevant metrics"}
+    }
+  ]
+}
 """
-        
-        response = client.chat.completions.create(
-            model=os.getenv("AZURE_OPENAI_DEPLOYMENT_NAME", "gpt-4"),
-            messages=[{"role": "user", "content": prompt}],
-            temperature=0.2,
-            max_tokens=2000
-        )
-        
-        # Parse the AI response
-        ai_response = response.choices[0].message.content
-        
-        # Extract JSON from the response (in case there's additional text)
-        try:
-            # Try to find JSON array in the response
-            start_idx = ai_response.find('[')
-            end_idx = ai_response.rfind(']') + 1
-            if start_idx >= 0 and end_idx > start_idx:
-                json_str = ai_response[start_idx:end_idx]
-                questions_data = json.loads(json_str)
-            else:
-                questions_data = json.loads(ai_response)
-        except json.JSONDecodeError:
-            logging.error(f"Failed to parse AI response as JSON: {ai_response}")
-            raise Exception("Invalid JSON response from AI")
-        
-        # Convert to Question objects
-        questions = []
-        for i, q_data in enumerate(questions_data):
-            question = Question(
-                id=q_data.get('id', f'q{i+1}'),
-                category=q_data.get('category', 'General'),
-                priority=QuestionPriority(q_data.get('priority', 'high')),
-                question_text=q_data.get('question_text', ''),
-                context=q_data.get('context', ''),
-                expected_response_type=ResponseType(q_data.get('expected_response_type', 'text')),
-                validation_rules=[],
-                related_data=q_data.get('related_data', {}),
-                order_sequence=i + 1,
-                generated_by_ai=True,
-                confidence_score=0.85
+
+def _question_cache_key(country: str, month: str, metrics: List[Dict[str, Any]]) -> str:
+    """Hash everything that determines the completion into a stable cache key"""
+    payload = orjson.dumps({
+        "country": country,
+        "month": month,
+        "metrics": metrics,
+        "model": _OPENAI_DEPLOYMENT,
+        "temperature": _QUESTION_TEMPERATURE
+    }, option=orjson.OPT_SORT_KEYS | orjson.OPT_NON_STR_KEYS)
+    return hashlib.sha256(payload).hexdigest()
+
+def _question_summary_stats(metrics: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """Portfolio totals for the question prompt"""
+    stats = _portfolio_stats(metrics)
+    return {
+        "total_contracts": stats["total_contracts"],
+        "total_net_book_value": stats["total_nbv"],
+        "total_delinquent_amount": stats["total_delinquent"],
+        "delinquency_rate": stats["delinquency_rate"]
+    }
+
+# Request options shared by real-time and batch question generation
+_QUESTION_REQUEST_OPTIONS = {
+    "temperature": _QUESTION_TEMPERATURE,
+    "max_tokens": 2000,
+    "response_format": {"type": "json_object"}
+}
+
+def _question_messages(country: str, month: str, metrics: List[Dict[str, Any]], summary_stats: Dict[str, Any]) -> List[Dict[str, str]]:
+    """Chat messages asking for questions about one country and month"""
+    currencies, prompt_rows = _compact_metrics_for_prompt(metrics)
+    
+    # Only the inputs go in the user message so the system prompt stays a stable prefix
+    user_message = f"""Country: {country}
+Month: {month}
+Currency: {", ".join(currencies) or "unknown"}
+
+SUMMARY STATISTICS:
+{orjson.dumps(summary_stats, option=orjson.OPT_SORT_KEYS).decode()}
+
+DETAILED METRICS BY GROUP:
+{orjson.dumps(prompt_rows, option=orjson.OPT_SORT_KEYS).decode()}
+"""
+    return [
+        {"role": "system", "content": _QUESTION_SYSTEM_PROMPT},
+        {"role": "user", "content": user_message}
+    ]
+
+def _parse_ai_questions(ai_response: str) -> List[Dict[str, Any]]:
+    """Read the questions array from a JSON-mode completion"""
+    try:
+        questions_data = orjson.loads(ai_response)["questions"]
+    except (orjson.JSONDecodeError, KeyError, TypeError):
+        _log.error("Failed to parse AI response as JSON: %s", ai_response)
+        raise Exception("Invalid JSON response from AI")
+    
+    return questions_data
+
+async def _request_ai_questions(country: str, month: str, metrics: List[Dict[str, Any]], summary_stats: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """Ask the model for questions and return its parsed JSON array"""
+    client = get_openai_client()
+    if not client:
+        raise Exception("OpenAI client not available")
+    
+    response = await create_completion(
+        client,
+        model=_OPENAI_DEPLOYMENT,
+        messages=_question_messages(country, month, metrics, summary_stats),
+        **_QUESTION_REQUEST_OPTIONS
+    )
+    
+    # JSON mode guarantees a parseable object, so the questions array is read directly
+    return _parse_ai_questions(response.choices[0].message.content)
+
+# Fields every model-generated question shares; validation_rules is an empty tuple so the
+# shared value cannot be mutated through one question (orjson still emits it as [])
+_AI_QUESTION_DEFAULTS = {
+    "validation_rules": (),
+    "follow_up_questions": None,
+    "generated_by_ai": True,
+    "confidence_score": 0.85
+}
+
+def _build_questions(questions_data: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Build Question-shaped dicts; the enums still reject unknown priorities/response types"""
+    return [
+        {
+            "id": q_data.get('id', f'q{i+1}'),
+            "category": q_data.get('category', 'General'),
+            "priority": QuestionPriority(q_data.get('priority', 'high')).value,
+            "question_text": q_data.get('question_text', ''),
+            "context": q_data.get('context', ''),
+            "expected_response_type": ResponseType(q_data.get('expected_response_type', 'text')).value,
+            "related_data": q_data.get('related_data', {}),
+            "order_sequence": i + 1,
+            **_AI_QUESTION_DEFAULTS
+        }
+        for i, q_data in enumerate(questions_data)
+    ]
+
+async def generate_ai_questions(country: str, month: str, metrics: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Generate AI-powered questions for non-empty country metrics, as Question-shaped dicts"""
+    try:
+        cache_key = _question_cache_key(country, month, metrics)
+        questions_data = _QUESTION_CACHE.get(cache_key)
+        if questions_data is not None:
+            _log.info("Serving cached AI questions for %s %s", country, month)
+        else:
+            # Concurrent requests for the same inputs share one model call
+            summary_stats = _question_summary_stats(metrics)
+            questions_data = await single_flight(
+                cache_key, lambda: _request_ai_questions(country, month, metrics, summary_stats)
             )
-            questions.append(question)
         
+        questions = _build_questions(questions_data)
+        
+        # Only cache completions that produced a valid questionnaire
+        _QUESTION_CACHE[cache_key] = questions_data
         return questions
         
     except Exception as e:
-        logging.error(f"Failed to generate AI questions: {str(e)}")
+        _log.error("Failed to generate AI questions: %s", e)
         raise
 
-# Add CORS headers helper
-def add_cors_headers(response: func.HttpResponse) -> func.HttpResponse:
-    """Add CORS headers to response"""
-    response.headers["Access-Control-Allow-Origin"] = "*"
-    response.headers["Access-Control-Allow-Methods"] = "GET, POST, PUT, DELETE, OPTIONS"
-    response.headers["Access-Control-Allow-Headers"] = "Content-Type, Authorization"
-    return response
+async def submit_batch_questionnaire(pairs: List[Tuple[str, str]]) -> Dict[str, Any]:
+    """Queue question generation for several (country, month) pairs as one Azure OpenAI batch job"""
+    client = get_openai_batch_client()
+    if not client:
+        raise Exception("OpenAI batch deployment not configured")
+    
+    # custom_id must be unique within a batch input file, so repeated pairs are queued once
+    pairs = list(dict.fromkeys(pairs))
+    
+    lines = []
+    skipped = []
+    for (country, month), metrics in zip(pairs, await fetch_many_country_metrics(pairs)):
+        if not metrics:
+            skipped.append({"country": country, "month": month})
+            continue
+        lines.append(orjson.dumps({
+            "custom_id": f"{country}|{month}",
+            "method": "POST",
+            "url": "/chat/completions",
+            "body": {
+                "model": _OPENAI_BATCH_DEPLOYMENT,
+                "messages": _question_messages(country, month, metrics, _question_summary_stats(metrics)),
+                **_QUESTION_REQUEST_OPTIONS
+            }
+        }))
+    
+    if not lines:
+        raise Exception("No metrics found for any requested country and month")
+    
+    input_file = await client.files.create(file=("questionnaires.jsonl", b"\n".join(lines)), purpose="batch")
+    batch = await client.batches.create(
+        input_file_id=input_file.id,
+        endpoint="/chat/completions",
+        completion_window="24h"
+    )
+    _log.info("Submitted questionnaire batch %s with %s requests", batch.id, len(lines))
+    
+    return {"batch_id": batch.id, "status": batch.status, "submitted": len(lines), "skipped": skipped}
+
+async def get_batch_questionnaire(batch_id: str) -> Dict[str, Any]:
+    """Report a questionnaire batch job's progress, with the generated questions once it has completed"""
+    client = get_openai_batch_client()
+    if not client:
+        raise Exception("OpenAI batch deployment not configured")
+    
+    batch = await client.batches.retrieve(batch_id)
+    result = {
+        "batch_id": batch.id,
+        "status": batch.status,
+        "request_counts": batch.request_counts.model_dump() if batch.request_counts else None
+    }
+    if batch.status != "completed" or not batch.output_file_id:
+        return result
+    
+    output = await client.files.content(batch.output_file_id)
+    questionnaires = []
+    for line in output.content.splitlines():
+        if not line.strip():
+            continue
+        entry = orjson.loads(line)
+        country, _, month = entry["custom_id"].partition("|")
+        item = {"country": country, "month": month}
+        if entry.get("error"):
+            item["error"] = entry["error"].get("message", "Batch request failed")
+            questionnaires.append(item)
+            continue
+        try:
+            ai_response = entry["response"]["body"]["choices"][0]["message"]["content"]
+            item["questions"] = _build_questions(_parse_ai_questions(ai_response))
+        except Exception as e:
+            item["error"] = str(e)
+        questionnaires.append(item)
+    
+    result["questionnaires"] = questionnaires
+    return result
+
+def _api_payload(data: Any, message: str = None, success: bool = True) -> Dict[str, Any]:
+    """Build an ApiResponse-shaped dict for server-authored data without Pydantic validation"""
+    return {
+        "success": success,
+        "data": data,
+        "error": None,
+        "message": message,
+        "timestamp": _utcnow()
+    }
 
 # ENDPOINTS START HERE
 
 @app.route(route="ai-summary", methods=["POST"])
-def create_ai_summary(req: func.HttpRequest) -> func.HttpResponse:
+async def create_ai_summary(req: func.HttpRequest) -> func.HttpResponse:
     """Generate AI-powered summary analysis of filtered portfolio data"""
-    logging.info('AI Summary endpoint called.')
+    _log.info('AI Summary endpoint called.')
     
     try:
         # Parse request body
-        req_body = req.get_json()
+        req_body = read_json_body(req)
         if not req_body:
-            response = func.HttpResponse(
-                json.dumps({"error": "Request body required"}),
-                status_code=400,
-                mimetype="application/json"
-            )
-            return add_cors_headers(response)
+            return json_response({"error": "Request body required"}, 400)
 
         # Extract parameters
         country = req_body.get('country')
@@ -837,28 +1223,18 @@ def create_ai_summary(req: func.HttpRequest) -> func.HttpResponse:
         
         # Validation
         if not all([country, month, group_type, metric]):
-            response = func.HttpResponse(
-                json.dumps({"error": "Country, month, group_type, and metric are required"}),
-                status_code=400,
-                mimetype="application/json"
-            )
-            return add_cors_headers(response)
+            return json_response({"error": "Country, month, group_type, and metric are required"}, 400)
         
         if not data or not isinstance(data, list):
-            response = func.HttpResponse(
-                json.dumps({"error": "Data array is required and must contain at least one record"}),
-                status_code=400,
-                mimetype="application/json"
-            )
-            return add_cors_headers(response)
+            return json_response({"error": "Data array is required and must contain at least one record"}, 400)
         
-        logging.info(f"Generating AI summary for {country}, {month}, {group_type}, {metric} with {len(data)} records")
+        _log.info("Generating AI summary for %s, %s, %s, %s with %s records", country, month, group_type, metric, len(data))
         
         # Generate AI summary
-        summary_text = generate_ai_summary(country, month, group_type, metric, data)
+        summary_text = await generate_ai_summary(country, month, group_type, metric, data)
         
         # Create response
-        api_response = ApiResponse(
+        api_response = _api_payload(
             success=True,
             data={
                 "summary": summary_text,
@@ -868,58 +1244,34 @@ def create_ai_summary(req: func.HttpRequest) -> func.HttpResponse:
                     "group_type": group_type,
                     "metric": metric,
                     "records_analyzed": len(data),
-                    "generated_at": datetime.utcnow().isoformat()
+                    "generated_at": _utcnow()
                 }
             },
-            message="AI summary generated successfully",
-            timestamp=datetime.utcnow().isoformat()
+            message="AI summary generated successfully"
         )
 
-        response = func.HttpResponse(
-            api_response.model_dump_json(),
-            status_code=200,
-            mimetype="application/json"
-        )
-        return add_cors_headers(response)
+        return json_response(api_response)
 
     except Exception as e:
-        logging.error(f"Failed to generate AI summary: {str(e)}")
-        error_response = ApiResponse(
+        _log.error("Failed to generate AI summary: %s", e)
+        error_response = _api_payload(
             success=False,
             data={},
-            message=f"Error generating AI summary: {str(e)}",
-            timestamp=datetime.utcnow().isoformat()
+            message=f"Error generating AI summary: {str(e)}"
         )
         
-        response = func.HttpResponse(
-            error_response.model_dump_json(),
-            status_code=500,
-            mimetype="application/json"
-        )
-        return add_cors_headers(response)
-
-# OPTIONS handler for CORS preflight requests
-@app.route(route="{*path}", methods=["OPTIONS"])
-def handle_options(req: func.HttpRequest) -> func.HttpResponse:
-    """Handle CORS preflight requests"""
-    response = func.HttpResponse("", status_code=200)
-    return add_cors_headers(response)
+        return json_response(error_response, 500)
 
 @app.route(route="chat", methods=["POST"])
-def chat_endpoint(req: func.HttpRequest) -> func.HttpResponse:
+async def chat_endpoint(req: func.HttpRequest) -> func.HttpResponse:
     """AI-powered chat endpoint for data quality questions with PowerPoint support"""
-    logging.info('Chat endpoint called.')
+    _log.info('Chat endpoint called.')
     
     try:
         # Parse request body
-        req_body = req.get_json()
+        req_body = read_json_body(req)
         if not req_body:
-            response = func.HttpResponse(
-                json.dumps({"error": "Request body required"}),
-                status_code=400,
-                mimetype="application/json"
-            )
-            return add_cors_headers(response)
+            return json_response({"error": "Request body required"}, 400)
 
         # Extract parameters
         question = req_body.get('question', '').strip()
@@ -932,30 +1284,15 @@ def chat_endpoint(req: func.HttpRequest) -> func.HttpResponse:
         
         # Validation
         if not question:
-            response = func.HttpResponse(
-                json.dumps({"error": "Question is required"}),
-                status_code=400,
-                mimetype="application/json"
-            )
-            return add_cors_headers(response)
+            return json_response({"error": "Question is required"}, 400)
             
         if not country or not month:
-            response = func.HttpResponse(
-                json.dumps({"error": "Country and month are required"}),
-                status_code=400,
-                mimetype="application/json"
-            )
-            return add_cors_headers(response)
+            return json_response({"error": "Country and month are required"}, 400)
         
-        logging.info(f"Processing chat question: '{question}' for {country}/{month}, PowerPoint: {is_powerpoint_request}")
+        _log.info("Processing chat question: '%s' for %s/%s, PowerPoint: %s", question, country, month, is_powerpoint_request)
         
         # Fetch relevant data from database
-        loop = asyncio.new_event_loop()
-        asyncio.set_event_loop(loop)
-        try:
-            metrics_data = loop.run_until_complete(fetch_country_metrics(country, month))
-        finally:
-            loop.close()
+        metrics_data = await fetch_country_metrics(country, month)
         
         if not metrics_data:
             # If no data available, still provide a helpful response
@@ -975,7 +1312,7 @@ Unfortunately, I don't have specific financial data available for {country} in {
 
 I'd be happy to help analyze the data once it becomes available. Is there anything else I can assist you with regarding data quality processes or general portfolio analysis?"""
 
-            api_response = ApiResponse(
+            api_response = _api_payload(
                 success=True,
                 data={
                     "response": ai_response,
@@ -990,37 +1327,30 @@ I'd be happy to help analyze the data once it becomes available. Is there anythi
                         "records_analyzed": 0
                     }
                 },
-                message="No data available response generated",
-                timestamp=datetime.utcnow().isoformat()
+                message="No data available response generated"
             )
         else:
             # Check for PowerPoint request
             if is_powerpoint_request:
-                logging.info(f"PowerPoint request detected via chat endpoint: {question}")
+                _log.info("PowerPoint request detected via chat endpoint: %s", question)
                 try:
-                    presentation_result = generate_powerpoint_content_react(question, country, month, metrics_data)
+                    presentation_result = await generate_powerpoint_content_react(question, country, month, metrics_data)
                     
-                    api_response = ApiResponse(
+                    api_response = _api_payload(
                         success=True,
                         data=presentation_result,
-                        message="PowerPoint presentation generated successfully via chat endpoint",
-                        timestamp=datetime.utcnow().isoformat()
+                        message="PowerPoint presentation generated successfully via chat endpoint"
                     )
                     
-                    response = func.HttpResponse(
-                        api_response.model_dump_json(),
-                        status_code=200,
-                        mimetype="application/json"
-                    )
-                    return add_cors_headers(response)
+                    return json_response(api_response)
                 except Exception as e:
-                    logging.error(f"PowerPoint generation failed in chat endpoint: {str(e)}")
+                    _log.error("PowerPoint generation failed in chat endpoint: %s", e)
                     # Fall through to regular chat response
             
             # Regular chat response
-            ai_response_data = generate_chat_response(question, country, month, context, metrics_data)
+            ai_response_data = await generate_chat_response(question, country, month, context, metrics_data)
             
-            api_response = ApiResponse(
+            api_response = _api_payload(
                 success=True,
                 data={
                     "response": ai_response_data,
@@ -1035,19 +1365,13 @@ I'd be happy to help analyze the data once it becomes available. Is there anythi
                         "records_analyzed": len(metrics_data)
                     }
                 },
-                message="Structured chat response generated successfully",
-                timestamp=datetime.utcnow().isoformat()
+                message="Structured chat response generated successfully"
             )
 
-        response = func.HttpResponse(
-            api_response.model_dump_json(),
-            status_code=200,
-            mimetype="application/json"
-        )
-        return add_cors_headers(response)
+        return json_response(api_response)
 
     except Exception as e:
-        logging.error(f"Failed to process chat request: {str(e)}")
+        _log.error("Failed to process chat request: %s", e)
         
         error_message = f"I apologize, but I encountered an error while processing your question: {str(e)}"
         
@@ -1056,106 +1380,89 @@ I'd be happy to help analyze the data once it becomes available. Is there anythi
         elif "Supabase" in str(e) or "database" in str(e).lower():
             error_message += "\n\nThis appears to be a data access issue. Please contact support if this persists."
         
-        error_response = ApiResponse(
+        error_response = _api_payload(
             success=False,
             data={
                 "response": error_message,
                 "question": req_body.get('question', ''),
                 "error_type": "processing_error"
             },
-            message=f"Error processing chat request: {str(e)}",
-            timestamp=datetime.utcnow().isoformat()
+            message=f"Error processing chat request: {str(e)}"
         )
         
-        response = func.HttpResponse(
-            error_response.model_dump_json(),
-            status_code=500,
-            mimetype="application/json"
-        )
-        return add_cors_headers(response)
+        return json_response(error_response, 500)
 
 @app.route(route="generate-presentation", methods=["POST"])
-def generate_presentation(req: func.HttpRequest) -> func.HttpResponse:
+async def generate_presentation(req: func.HttpRequest) -> func.HttpResponse:
     """Generate PowerPoint presentation using ReAct approach"""
-    logging.info('Generate presentation endpoint called.')
+    _log.info('Generate presentation endpoint called.')
     
     try:
-        req_body = req.get_json()
+        req_body = read_json_body(req)
         if not req_body:
-            response = func.HttpResponse(
-                json.dumps({"error": "Request body required"}),
-                status_code=400,
-                mimetype="application/json"
-            )
-            return add_cors_headers(response)
+            return json_response({"error": "Request body required"}, 400)
 
         question = req_body.get('question', '').strip()
         country = req_body.get('country', '').strip()
         month = req_body.get('month', '').strip()
         
         if not all([question, country, month]):
-            response = func.HttpResponse(
-                json.dumps({"error": "Question, country, and month are required"}),
-                status_code=400,
-                mimetype="application/json"
-            )
-            return add_cors_headers(response)
+            return json_response({"error": "Question, country, and month are required"}, 400)
         
-        logging.info(f"Generating presentation for: '{question}' - {country}/{month}")
+        _log.info("Generating presentation for: '%s' - %s/%s", question, country, month)
         
         # Fetch data
-        loop = asyncio.new_event_loop()
-        asyncio.set_event_loop(loop)
-        try:
-            metrics_data = loop.run_until_complete(fetch_country_metrics(country, month))
-        finally:
-            loop.close()
+        metrics_data = await fetch_country_metrics(country, month)
         
         if not metrics_data:
-            response = func.HttpResponse(
-                json.dumps({"error": f"No data available for {country} in {month}"}),
-                status_code=404,
-                mimetype="application/json"
-            )
-            return add_cors_headers(response)
+            return json_response({"error": f"No data available for {country} in {month}"}, 404)
         
         # Generate presentation using ReAct
-        presentation_result = generate_powerpoint_content_react(question, country, month, metrics_data)
+        presentation_result = await generate_powerpoint_content_react(question, country, month, metrics_data)
         
-        api_response = ApiResponse(
+        api_response = _api_payload(
             success=True,
             data=presentation_result,
-            message="PowerPoint presentation generated successfully",
-            timestamp=datetime.utcnow().isoformat()
+            message="PowerPoint presentation generated successfully"
         )
 
-        response = func.HttpResponse(
-            api_response.model_dump_json(),
-            status_code=200,
-            mimetype="application/json"
-        )
-        return add_cors_headers(response)
+        return json_response(api_response)
 
     except Exception as e:
-        logging.error(f"Failed to generate presentation: {str(e)}")
-        error_response = ApiResponse(
+        _log.error("Failed to generate presentation: %s", e)
+        error_response = _api_payload(
             success=False,
             data={},
-            message=f"Error generating presentation: {str(e)}",
-            timestamp=datetime.utcnow().isoformat()
+            message=f"Error generating presentation: {str(e)}"
         )
         
-        response = func.HttpResponse(
-            error_response.model_dump_json(),
-            status_code=500,
-            mimetype="application/json"
-        )
-        return add_cors_headers(response)
+        return json_response(error_response, 500)
+
+# Monitoring probes poll the connectivity checks, so Supabase is queried at most once every
+# five seconds and concurrent probes share that outcome, failures included
+_SUPABASE_PROBE_CACHE = TTLCache(maxsize=1, ttl=5)
+_SUPABASE_PROBE_LOCK = asyncio.Lock()
+
+async def _probe_supabase() -> List[Dict[str, Any]]:
+    """Fetch one sample row from Supabase, reusing a probe from the last few seconds"""
+    async with _SUPABASE_PROBE_LOCK:
+        outcome = _SUPABASE_PROBE_CACHE.get("probe")
+        if outcome is None:
+            try:
+                outcome = (True, await supabase_request("country_group_metrics", limit=1))
+            except Exception as e:
+                outcome = (False, str(e))
+            _SUPABASE_PROBE_CACHE["probe"] = outcome
+    
+    ok, value = outcome
+    if not ok:
+        raise Exception(value)
+    return value
 
 @app.route(route="chat/health", methods=["GET"])
-def chat_health_check(req: func.HttpRequest) -> func.HttpResponse:
+async def chat_health_check(req: func.HttpRequest) -> func.HttpResponse:
     """Health check specifically for chat functionality"""
-    logging.info('Chat health check endpoint called.')
+    _log.info('Chat health check endpoint called.')
     
     try:
         # Test OpenAI client
@@ -1165,10 +1472,7 @@ def chat_health_check(req: func.HttpRequest) -> func.HttpResponse:
         # Test database connection with a simple query
         db_status = "healthy"
         try:
-            loop = asyncio.new_event_loop()
-            asyncio.set_event_loop(loop)
-            test_result = loop.run_until_complete(supabase_request("country_group_metrics", {"limit": "1"}))
-            loop.close()
+            test_result = await _probe_supabase()
             if not test_result:
                 db_status = "no_data"
         except Exception:
@@ -1179,360 +1483,273 @@ def chat_health_check(req: func.HttpRequest) -> func.HttpResponse:
             "openai_client": openai_status,
             "database_connection": db_status,
             "available_endpoints": ["/api/chat", "/api/generate-presentation"],
-            "timestamp": datetime.utcnow().isoformat()
+            "timestamp": _utcnow()
         }
 
-        response = func.HttpResponse(
-            json.dumps(health_data),
-            status_code=200,
-            mimetype="application/json"
-        )
-        return add_cors_headers(response)
+        return json_response(health_data)
 
     except Exception as e:
-        logging.error(f"Chat health check failed: {str(e)}")
-        response = func.HttpResponse(
-            json.dumps({
-                "chat_service": "error",
-                "error": str(e),
-                "timestamp": datetime.utcnow().isoformat()
-            }),
-            status_code=500,
-            mimetype="application/json"
-        )
-        return add_cors_headers(response)
+        _log.error("Chat health check failed: %s", e)
+        return json_response({
+            "chat_service": "error",
+            "error": str(e),
+            "timestamp": _utcnow()
+        }, 500)
+
+# App settings only change when the worker restarts, so the health body is serialized
+# once with the closing brace left open for the per-second timestamp
+_OPENAI_STATUS = "configured" if _OPENAI_API_KEY and _OPENAI_ENDPOINT else "not_configured"
+_DATABASE_STATUS = "configured" if _SUPABASE_URL and _SUPABASE_KEY else "not_configured"
+_HEALTH_BODY_PREFIX = orjson.dumps({
+    "status": "healthy",
+    "services": {
+        "api": "running",
+        "openai": _OPENAI_STATUS,
+        "database": _DATABASE_STATUS
+    }
+})[:-1] + b',"timestamp":"'
 
-@app.route(route="health", methods=["GET"])
 def health_check(req: func.HttpRequest) -> func.HttpResponse:
     """Health check endpoint"""
-    logging.info('Health check endpoint called.')
-    
-    try:
-        # Check if Azure OpenAI is configured
-        openai_key = os.getenv("AZURE_OPENAI_API_KEY")
-        openai_endpoint = os.getenv("AZURE_OPENAI_ENDPOINT")
-        openai_status = "configured" if openai_key and openai_endpoint else "not_configured"
-        
-        # Check database connection
-        db_status = "not_configured"
-        try:
-            supabase_url = os.getenv("SUPABASE_URL")
-            supabase_key = os.getenv("SUPABASE_ANON_KEY")
-            db_status = "configured" if supabase_url and supabase_key else "not_configured"
-        except:
-            db_status = "error"
-
-        health_data = HealthCheck(
-            status="healthy",
-            services={
-                "api": "running",
-                "openai": openai_status,
-                "database": db_status
-            },
-            timestamp=datetime.utcnow().isoformat()
-        )
-
-        response = func.HttpResponse(
-            health_data.model_dump_json(),
-            status_code=200,
-            mimetype="application/json"
-        )
-        return add_cors_headers(response)
-
-    except Exception as e:
-        logging.error(f"Health check failed: {str(e)}")
-        error_data = HealthCheck(
-            status="error",
-            services={"api": "error", "openai": "error", "database": "error"},
-            timestamp=datetime.utcnow().isoformat()
-        )
-        
-        response = func.HttpResponse(
-            error_data.model_dump_json(),
-            status_code=500,
-            mimetype="application/json"
-        )
-        return add_cors_headers(response)
+    return func.HttpResponse(
+        _HEALTH_BODY_PREFIX + _now_iso().encode() + b'"}',
+        status_code=200,
+        headers=JSON_HEADERS
+    )
 
 @app.route(route="test-supabase-api", methods=["GET"])
-def test_supabase_api(req: func.HttpRequest) -> func.HttpResponse:
+async def test_supabase_api(req: func.HttpRequest) -> func.HttpResponse:
     """Test Supabase REST API connection"""
-    logging.info('Test Supabase API endpoint called.')
+    _log.info('Test Supabase API endpoint called.')
     
     try:
-        loop = asyncio.new_event_loop()
-        asyncio.set_event_loop(loop)
-        
-        async def test_api():
-            result = await supabase_request("country_group_metrics", {"limit": "1"})
-            return result
-        
-        result = loop.run_until_complete(test_api())
-        loop.close()
-        
-        response = func.HttpResponse(
-            json.dumps({
-                "success": True, 
-                "message": "Supabase API connection successful",
-                "sample_data": result[:1] if result else "No data found"
-            }),
-            status_code=200,
-            mimetype="application/json"
-        )
-        return add_cors_headers(response)
+        result = await _probe_supabase()
+        
+        return json_response({
+            "success": True, 
+            "message": "Supabase API connection successful",
+            "sample_data": result[:1] if result else "No data found"
+        })
         
     except Exception as e:
-        logging.error(f"Supabase API test failed: {str(e)}")
-        response = func.HttpResponse(
-            json.dumps({"success": False, "error": str(e)}),
-            status_code=500,
-            mimetype="application/json"
-        )
-        return add_cors_headers(response)
+        _log.error("Supabase API test failed: %s", e)
+        return json_response({"success": False, "error": str(e)}, 500)
+
+# Everything but the timestamp is static: serialize it once and leave the closing brace open
+_WELCOME_BODY_PREFIX = orjson.dumps({
+    "message": "Welcome to DQAgent API",
+    "version": "1.0.0",
+    "endpoints": {
+        "health": "/api/health",
+        "countries": "/api/countries", 
+        "generate_questionnaire": "/api/questionnaire/generate",
+        "questionnaire_batch": "/api/questionnaire/batch",
+        "country_metrics": "/api/country-metrics/{country}/{month}",
+        "chat": "/api/chat",
+        "ai_summary": "/api/ai-summary",
+        "generate_presentation": "/api/generate-presentation",
+        "test_supabase": "/api/test-supabase-api",
+        "chat_health": "/api/chat/health"
+    }
+})[:-1] + b',"timestamp":"'
 
-@app.route(route="welcome", methods=["GET"])
 def welcome(req: func.HttpRequest) -> func.HttpResponse:
     """Welcome endpoint"""
-    logging.info('Welcome endpoint called.')
-    
-    welcome_data = {
-        "message": "Welcome to DQAgent API",
-        "version": "1.0.0",
-        "endpoints": {
-            "health": "/api/health",
-            "countries": "/api/countries", 
-            "generate_questionnaire": "/api/questionnaire/generate",
-            "country_metrics": "/api/country-metrics/{country}/{month}",
-            "chat": "/api/chat",
-            "ai_summary": "/api/ai-summary",
-            "generate_presentation": "/api/generate-presentation",
-            "test_supabase": "/api/test-supabase-api",
-            "chat_health": "/api/chat/health"
-        },
-        "timestamp": datetime.utcnow().isoformat()
-    }
-    
-    response = func.HttpResponse(
-        json.dumps(welcome_data),
+    return func.HttpResponse(
+        _WELCOME_BODY_PREFIX + _now_iso().encode() + b'"}',
         status_code=200,
-        mimetype="application/json"
+        headers=JSON_HEADERS
     )
-    return add_cors_headers(response)
 
-@app.route(route="countries", methods=["GET"])
-def get_countries(req: func.HttpRequest) -> func.HttpResponse:
-    """Get list of supported countries"""
-    logging.info('Countries endpoint called.')
-    
-    try:
-        countries = [
-            Country(
-                code="NL",
-                name="Netherlands",
-                entity_id="76",
-                entity_name="Daimler Truck FS",
-                active=True,
-                region="Europe"
-            ),
-            Country(
-                code="DE",
-                name="Germany",
-                entity_id="77",
-                entity_name="Daimler Truck FS",
-                active=True,
-                region="Europe"
-            ),
-            Country(
-                code="ES",
-                name="Spain",
-                entity_id="78",
-                entity_name="Daimler Truck FS",
-                active=True,
-                region="Europe"
-            )
-        ]
+# Supported countries are static, so the response body is serialized once at import
+_COUNTRIES = (
+    {"code": "NL", "name": "Netherlands", "entity_id": "76", "entity_name": "Daimler Truck FS", "active": True, "region": "Europe"},
+    {"code": "DE", "name": "Germany", "entity_id": "77", "entity_name": "Daimler Truck FS", "active": True, "region": "Europe"},
+    {"code": "ES", "name": "Spain", "entity_id": "78", "entity_name": "Daimler Truck FS", "active": True, "region": "Europe"},
+)
 
-        api_response = ApiResponse(
-            success=True,
-            data={"countries": [country.model_dump() for country in countries]},
-            timestamp=datetime.utcnow().isoformat()
-        )
+_COUNTRIES_BODY = orjson.dumps({
+    "success": True,
+    "data": {"countries": _COUNTRIES},
+    "error": None,
+    "message": None
+})
 
-        response = func.HttpResponse(
-            api_response.model_dump_json(),
-            status_code=200,
-            mimetype="application/json"
-        )
-        return add_cors_headers(response)
+# The body carries no timestamp, so the whole response is built once at import
+_COUNTRIES_RESPONSE = func.HttpResponse(_COUNTRIES_BODY, status_code=200, headers=JSON_HEADERS)
 
-    except Exception as e:
-        logging.error(f"Error in countries endpoint: {str(e)}")
-        error_response = ApiResponse(
-            success=False,
-            data={},
-            message=f"Error: {str(e)}",
-            timestamp=datetime.utcnow().isoformat()
-        )
-        
-        response = func.HttpResponse(
-            error_response.model_dump_json(),
-            status_code=500,
-            mimetype="application/json"
-        )
-        return add_cors_headers(response)
+def get_countries(req: func.HttpRequest) -> func.HttpResponse:
+    """Get list of supported countries"""
+    _log.info('Countries endpoint called.')
+    
+    return _COUNTRIES_RESPONSE
+
+# health, welcome and countries are served from precomputed data, so they share a single
+# registered function that dispatches on the route segment
+_STATIC_HANDLERS = {
+    "health": health_check,
+    "welcome": welcome,
+    "countries": get_countries
+}
+
+@app.route(route="{resource:regex(^(health|welcome|countries)$)}", methods=["GET"])
+def static_resources(req: func.HttpRequest) -> func.HttpResponse:
+    """Serve the health, welcome and countries endpoints"""
+    # Route constraints match case-insensitively
+    resource = req.route_params.get('resource', '').lower()
+    return _STATIC_HANDLERS[resource](req)
 
 @app.route(route="country-metrics/{country}/{month}", methods=["GET"])
-def get_country_metrics(req: func.HttpRequest) -> func.HttpResponse:
+async def get_country_metrics(req: func.HttpRequest) -> func.HttpResponse:
     """Get country metrics for a specific country and month"""
-    logging.info('Country metrics endpoint called.')
+    _log.info('Country metrics endpoint called.')
     
     try:
         country = req.route_params.get('country')
         month = req.route_params.get('month')
         
         if not country or not month:
-            response = func.HttpResponse(
-                json.dumps({"error": "Country and month parameters required"}),
-                status_code=400,
-                mimetype="application/json"
-            )
-            return add_cors_headers(response)
+            return json_response({"error": "Country and month parameters required"}, 400)
         
         # Fetch metrics from database
-        loop = asyncio.new_event_loop()
-        asyncio.set_event_loop(loop)
-        try:
-            metrics = loop.run_until_complete(fetch_country_metrics(country, month))
-        finally:
-            loop.close()
+        metrics = await fetch_country_metrics(country, month)
         
         if not metrics:
-            response = func.HttpResponse(
-                json.dumps({"error": f"No metrics found for {country} in {month}"}),
-                status_code=404,
-                mimetype="application/json"
-            )
-            return add_cors_headers(response)
+            return json_response({"error": f"No metrics found for {country} in {month}"}, 404)
         
-        api_response = ApiResponse(
+        api_response = _api_payload(
             success=True,
             data={
                 "country": country,
                 "month": month,
                 "metrics": metrics,
                 "total_records": len(metrics)
-            },
-            timestamp=datetime.utcnow().isoformat()
+            }
         )
 
-        response = func.HttpResponse(
-            api_response.model_dump_json(),
-            status_code=200,
-            mimetype="application/json"
-        )
-        return add_cors_headers(response)
+        return json_response(api_response)
 
     except Exception as e:
-        logging.error(f"Error in country metrics endpoint: {str(e)}")
-        error_response = ApiResponse(
+        _log.error("Error in country metrics endpoint: %s", e)
+        error_response = _api_payload(
             success=False,
             data={},
-            message=f"Error: {str(e)}",
-            timestamp=datetime.utcnow().isoformat()
+            message=f"Error: {str(e)}"
         )
         
-        response = func.HttpResponse(
-            error_response.model_dump_json(),
-            status_code=500,
-            mimetype="application/json"
-        )
-        return add_cors_headers(response)
+        return json_response(error_response, 500)
 
 @app.route(route="questionnaire/generate", methods=["POST"])
-def generate_questionnaire(req: func.HttpRequest) -> func.HttpResponse:
+async def generate_questionnaire(req: func.HttpRequest) -> func.HttpResponse:
     """Generate AI-powered questionnaire from country metrics"""
-    logging.info('Generate questionnaire endpoint called.')
+    _log.info('Generate questionnaire endpoint called.')
     
     try:
         # Parse request body
-        req_body = req.get_json()
+        req_body = read_json_body(req)
         if not req_body:
-            response = func.HttpResponse(
-                json.dumps({"error": "Request body required"}),
-                status_code=400,
-                mimetype="application/json"
-            )
-            return add_cors_headers(response)
+            return json_response({"error": "Request body required"}, 400)
 
         # Extract country and month from request
         country = req_body.get('country')
         month = req_body.get('month')
         
         if not country or not month:
-            response = func.HttpResponse(
-                json.dumps({"error": "Country and month are required"}),
-                status_code=400,
-                mimetype="application/json"
-            )
-            return add_cors_headers(response)
+            return json_response({"error": "Country and month are required"}, 400)
         
         # Fetch metrics from database
-        loop = asyncio.new_event_loop()
-        asyncio.set_event_loop(loop)
-        try:
-            metrics = loop.run_until_complete(fetch_country_metrics(country, month))
-        finally:
-            loop.close()
+        metrics = await fetch_country_metrics(country, month)
         
         if not metrics:
-            response = func.HttpResponse(
-                json.dumps({"error": f"No metrics found for {country} in {month}"}),
-                status_code=404,
-                mimetype="application/json"
-            )
-            return add_cors_headers(response)
+            return json_response({"error": f"No metrics found for {country} in {month}"}, 404)
         
         # Generate AI questions
-        questions = generate_ai_questions(country, month, metrics)
+        questions = await generate_ai_questions(country, month, metrics)
+        
+        # Create summary, tallying priorities and categories in one pass
+        high_priority = critical_priority = 0
+        categories = set()
+        for q in questions:
+            categories.add(q["category"])
+            if q["priority"] == QuestionPriority.HIGH:
+                high_priority += 1
+            elif q["priority"] == QuestionPriority.CRITICAL:
+                critical_priority += 1
         
-        # Create summary
         summary = {
             "total_questions": len(questions),
-            "high_priority": len([q for q in questions if q.priority == QuestionPriority.HIGH]),
-            "critical_priority": len([q for q in questions if q.priority == QuestionPriority.CRITICAL]),
-            "categories": list(set([q.category for q in questions])),
-            "requires_immediate_attention": any(q.priority == QuestionPriority.CRITICAL for q in questions),
+            "high_priority": high_priority,
+            "critical_priority": critical_priority,
+            "categories": list(categories),
+            "requires_immediate_attention": critical_priority > 0,
             "data_points_analyzed": len(metrics)
         }
         
-        questionnaire_response = QuestionGenerationResponse(
-            country=country,
-            entity="Daimler Truck FS",
-            report_date=month,
-            questions=questions,
-            summary=summary
-        )
+        questionnaire_response = {
+            "country": country,
+            "entity": "Daimler Truck FS",
+            "report_date": month,
+            "questions": questions,
+            "summary": summary
+        }
 
-        response = func.HttpResponse(
-            questionnaire_response.model_dump_json(),
-            status_code=200,
-            mimetype="application/json"
-        )
-        return add_cors_headers(response)
+        return json_response(questionnaire_response)
 
     except Exception as e:
-        logging.error(f"Failed to generate questionnaire: {str(e)}")
-        response = func.HttpResponse(
-            json.dumps({"error": f"Failed to generate questionnaire: {str(e)}"}),
-            status_code=500,
-            mimetype="application/json"
-        )
-        return add_cors_headers(response)
+        _log.error("Failed to generate questionnaire: %s", e)
+        return json_response({"error": f"Failed to generate questionnaire: {str(e)}"}, 500)
+
+@app.route(route="questionnaire/batch", methods=["POST"])
+async def submit_questionnaire_batch(req: func.HttpRequest) -> func.HttpResponse:
+    """Queue AI questionnaire generation for several countries/months on the Azure OpenAI Batch API"""
+    _log.info('Submit questionnaire batch endpoint called.')
+    
+    try:
+        req_body = read_json_body(req)
+        if not req_body:
+            return json_response({"error": "Request body required"}, 400)
+
+        requests = req_body.get('requests')
+        if not requests or not isinstance(requests, list):
+            return json_response({"error": "A non-empty requests array of {country, month} is required"}, 400)
+        
+        pairs = [(item.get('country'), item.get('month')) for item in requests if isinstance(item, dict)]
+        if len(pairs) != len(requests) or not all(
+            isinstance(country, str) and isinstance(month, str) and country and month for country, month in pairs
+        ):
+            return json_response({"error": "Every request needs a country and a month"}, 400)
+        # Results are matched back through custom_id "country|month", so neither part may contain "|"
+        if any("|" in country or "|" in month for country, month in pairs):
+            return json_response({"error": "Country and month must not contain '|'"}, 400)
+        
+        batch = await submit_batch_questionnaire(pairs)
+        
+        return json_response(_api_payload(batch, message="Questionnaire batch submitted"), 202)
+
+    except Exception as e:
+        _log.error("Failed to submit questionnaire batch: %s", e)
+        return json_response({"error": f"Failed to submit questionnaire batch: {str(e)}"}, 500)
+
+@app.route(route="questionnaire/batch/{batch_id}", methods=["GET"])
+async def get_questionnaire_batch(req: func.HttpRequest) -> func.HttpResponse:
+    """Get the status of a questionnaire batch and its questions once completed"""
+    _log.info('Get questionnaire batch endpoint called.')
+    
+    try:
+        batch_id = req.route_params.get('batch_id')
+        
+        batch = await get_batch_questionnaire(batch_id)
+        
+        return json_response(_api_payload(batch))
+
+    except Exception as e:
+        _log.error("Failed to get questionnaire batch: %s", e)
+        return json_response({"error": f"Failed to get questionnaire batch: {str(e)}"}, 500)
 
 @app.route(route="questionnaire/{questionnaire_id}", methods=["GET"])
 def get_questionnaire(req: func.HttpRequest) -> func.HttpResponse:
     """Get questionnaire details and questions"""
-    logging.info('Get questionnaire endpoint called.')
+    _log.info('Get questionnaire endpoint called.')
     
     try:
         questionnaire_id = req.route_params.get('questionnaire_id')
@@ -1553,80 +1770,47 @@ def get_questionnaire(req: func.HttpRequest) -> func.HttpResponse:
             }
         }
 
-        api_response = ApiResponse(
-            success=True,
-            data=mock_questionnaire,
-            timestamp=datetime.utcnow().isoformat()
-        )
-
-        response = func.HttpResponse(
-            api_response.model_dump_json(),
-            status_code=200,
-            mimetype="application/json"
-        )
-        return add_cors_headers(response)
+        return json_response(_api_payload(mock_questionnaire))
 
     except Exception as e:
-        logging.error(f"Failed to get questionnaire: {str(e)}")
-        response = func.HttpResponse(
-            json.dumps({"error": f"Failed to get questionnaire: {str(e)}"}),
-            status_code=500,
-            mimetype="application/json"
-        )
-        return add_cors_headers(response)
+        _log.error("Failed to get questionnaire: %s", e)
+        return json_response({"error": f"Failed to get questionnaire: {str(e)}"}, 500)
 
 @app.route(route="questionnaire/{questionnaire_id}/response", methods=["POST"])
 def submit_response(req: func.HttpRequest) -> func.HttpResponse:
     """Submit response to a specific question"""
-    logging.info('Submit response endpoint called.')
+    _log.info('Submit response endpoint called.')
     
     try:
         questionnaire_id = req.route_params.get('questionnaire_id')
         
         # Parse request body
-        req_body = req.get_json()
+        req_body = read_json_body(req)
         if not req_body:
-            response = func.HttpResponse(
-                json.dumps({"error": "Request body required"}),
-                status_code=400,
-                mimetype="application/json"
-            )
-            return add_cors_headers(response)
+            return json_response({"error": "Request body required"}, 400)
 
         request_data = ResponseSubmissionRequest(**req_body)
 
         # TODO: Implement actual response processing and validation
         # For now, return a mock success response
-        mock_validation = ValidationResult(
-            is_valid=True,
-            validation_score=0.85,
-            issues=[],
-            suggestions=["Consider adding more specific timeline information"]
-        )
+        mock_validation = {
+            "is_valid": True,
+            "validation_score": 0.85,
+            "issues": [],
+            "suggestions": ["Consider adding more specific timeline information"]
+        }
 
-        api_response = ApiResponse(
-            success=True,
-            data={
+        api_response = _api_payload(
+            {
                 "response_id": f"resp_{questionnaire_id}_{request_data.question_id}",
-                "validation": mock_validation.model_dump(),
+                "validation": mock_validation,
                 "status": "completed"
             },
-            message="Response submitted successfully",
-            timestamp=datetime.utcnow().isoformat()
+            message="Response submitted successfully"
         )
 
-        response = func.HttpResponse(
-            api_response.model_dump_json(),
-            status_code=200,
-            mimetype="application/json"
-        )
-        return add_cors_headers(response)
+        return json_response(api_response)
 
     except Exception as e:
-        logging.error(f"Failed to submit response: {str(e)}")
-        response = func.HttpResponse(
-            json.dumps({"error": f"Failed to submit response: {str(e)}"}),
-            status_code=500,
-            mimetype="application/json"
-        )
-        return add_cors_headers(response)
\ No newline at end of file
+        _log.error("Failed to submit response: %s", e)
+        return json_response({"error": f"Failed to submit response: {str(e)}"}, 500)
\ No newline at end of file
@@ -1,48 +1,66 @@
 # backend/functions/questionnaire_generator.py
+import asyncio
 import json
 import logging
+from collections import Counter
 from typing import Dict, Any, List
 from datetime import datetime
-from models.question_models import Question, QuestionPriority, ResponseType, QuestionGenerationResponse
+from models.question_models import Question, QuestionPriority, ResponseType, QuestionGenerationResponse, QuestionGenerationSummary
 from services.openai_service import OpenAIService
 
+# Sort rank for each priority; unknown priorities sort with "low"
+_PRIORITY_ORDER = {"critical": 0, "high": 1, "medium": 2, "low": 3}
+
 async def generate_questionnaire(dq_data: Dict[str, Any], country: str, openai_service: OpenAIService) -> QuestionGenerationResponse:
     """Generate complete questionnaire from DQ report data"""
     
     questions = []
     
-    # Generate questions for each category
-    questions.extend(await generate_overview_questions(dq_data, openai_service))
-    questions.extend(await generate_additional_info_questions(dq_data, openai_service))
-    questions.extend(await generate_writeoff_questions(dq_data, openai_service))
-    questions.extend(await generate_error_warning_questions(dq_data, openai_service))
+    # One timestamp for every question ID in this questionnaire; the ID prefixes keep them unique
+    ts = datetime.now().strftime('%Y%m%d_%H%M%S')
+    
+    # Generate questions for each category concurrently; gather keeps the category order
+    category_questions = await asyncio.gather(
+        generate_overview_questions(dq_data, openai_service, ts),
+        generate_additional_info_questions(dq_data, openai_service, ts),
+        generate_writeoff_questions(dq_data, openai_service, ts),
+        generate_error_warning_questions(dq_data, openai_service, ts)
+    )
+    for generated in category_questions:
+        questions.extend(generated)
     
     # Sort by priority
-    priority_order = {"critical": 0, "high": 1, "medium": 2, "low": 3}
-    questions.sort(key=lambda x: (priority_order.get(x.priority, 3), x.order_sequence))
+    questions.sort(key=lambda x: (_PRIORITY_ORDER.get(x.priority, 3), x.order_sequence))
     
     # Update order sequence
     for i, question in enumerate(questions):
         question.order_sequence = i + 1
     
-    # Generate summary
+    # Generate summary, tallying priorities and categories in one pass
+    priority_counts = Counter()
+    categories = set()
+    for question in questions:
+        priority_counts[question.priority] += 1
+        categories.add(question.category)
+    
     summary = {
         "total_questions": len(questions),
-        "high_priority": len([q for q in questions if q.priority == "high"]),
-        "critical_priority": len([q for q in questions if q.priority == "critical"]),
-        "categories": list(set(q.category for q in questions)),
-        "requires_immediate_attention": any(q.priority in ["critical", "high"] for q in questions)
+        "high_priority": priority_counts[QuestionPriority.HIGH],
+        "critical_priority": priority_counts[QuestionPriority.CRITICAL],
+        "categories": list(categories),
+        "requires_immediate_attention": bool(priority_counts[QuestionPriority.CRITICAL] or priority_counts[QuestionPriority.HIGH])
     }
     
-    return QuestionGenerationResponse(
+    # Everything here is built in-process from typed values, so pydantic validation is skipped
+    return QuestionGenerationResponse.model_construct(
         country=country,
         entity=dq_data.get('metadata', {}).get('delivering_entity_name', 'Unknown'),
         report_date=dq_data.get('metadata', {}).get('reporting_date', ''),
         questions=questions,
-        summary=summary
+        summary=QuestionGenerationSummary.model_construct(**summary)
     )
 
-async def generate_overview_questions(dq_data: Dict[str, Any], openai_service: OpenAIService) -> List[Question]:
+async def generate_overview_questions(dq_data: Dict[str, Any], openai_service: OpenAIService, ts: str) -> List[Question]:
     """Generate questions based on overview/portfolio analysis"""
     questions = []
     overview = dq_data.get('overview', {})
@@ -62,8 +80,8 @@ async def generate_overview_questions(dq_data: Dict[str, Any], openai_service: O
     if relevant_portfolio and relevant_portfolio.get('delinquent_amount', 0) > 500000:
         delinquent_amount = relevant_portfolio['delinquent_amount']
         
-        questions.append(Question(
-            id=f"overview_delinquent_{datetime.now().strftime('%Y%m%d_%H%M%S')}",
+        questions.append(Question.model_construct(
+            id=f"overview_delinquent_{ts}",
             category="Overview",
             priority=QuestionPriority.CRITICAL,
             question_text=f"It has been observed that there is a considerable increase in delinquent amount (€{delinquent_amount:,.2f}) and change in the NBV of the relevant portfolio compared to the previous month. Can you please provide additional information on this?",
@@ -82,8 +100,8 @@ async def generate_overview_questions(dq_data: Dict[str, Any], openai_service: O
     
     # Generate error portfolio question
     if error_portfolio and error_portfolio.get('no_of_contracts', 0) > 0:
-        questions.append(Question(
-            id=f"overview_errors_{datetime.now().strftime('%Y%m%d_%H%M%S')}",
+        questions.append(Question.model_construct(
+            id=f"overview_errors_{ts}",
             category="Overview",
             priority=QuestionPriority.HIGH,
             question_text=f"There are {error_portfolio['no_of_contracts']} contracts in the Error portfolio with negative amounts detected. Please explain the nature of these errors and your remediation plan.",
@@ -102,30 +120,30 @@ async def generate_overview_questions(dq_data: Dict[str, Any], openai_service: O
     
     return questions
 
-async def generate_additional_info_questions(dq_data: Dict[str, Any], openai_service: OpenAIService) -> List[Question]:
+async def generate_additional_info_questions(dq_data: Dict[str, Any], openai_service: OpenAIService, ts: str) -> List[Question]:
     """Generate questions based on Additional Information changes"""
     questions = []
     additional_info = dq_data.get('additional_info', {})
     changes = additional_info.get('changes', {})
     
-    # Identify significant changes (matching Netherlands pattern)
+    # Identify significant changes (matching Netherlands pattern), collecting the
+    # first five for the question text in the same pass
     significant_changes = {}
     high_impact_changes = []
+    change_summary = []
     
     for change_type, count in changes.items():
         if count > 10:  # Threshold for significance
             significant_changes[change_type] = count
+            if len(change_summary) < 5:  # Top 5 changes
+                change_summary.append(f"{change_type}: {count}")
             if count > 50:  # High impact threshold
                 high_impact_changes.append(f"{change_type}: {count}")
     
     if significant_changes:
         # Create question similar to Netherlands example
-        change_summary = []
-        for change_type, count in list(significant_changes.items())[:5]:  # Top 5 changes
-            change_summary.append(f"{change_type}: {count}")
-        
-        questions.append(Question(
-            id=f"additional_changes_{datetime.now().strftime('%Y%m%d_%H%M%S')}",
+        questions.append(Question.model_construct(
+            id=f"additional_changes_{ts}",
             category="Additional Information",
             priority=QuestionPriority.HIGH if high_impact_changes else QuestionPriority.MEDIUM,
             question_text=f"You'll find the list of contracts in the \"Additional Information\" sheet of the DQ report. Can you please provide clarifications on the changes highlighted: {'; '.join(change_summary)}",
@@ -150,7 +168,7 @@ async def generate_additional_info_questions(dq_data: Dict[str, Any], openai_ser
     
     return questions
 
-async def generate_writeoff_questions(dq_data: Dict[str, Any], openai_service: OpenAIService) -> List[Question]:
+async def generate_writeoff_questions(dq_data: Dict[str, Any], openai_service: OpenAIService, ts: str) -> List[Question]:
     """Generate writeoff-related questions"""
     questions = []
     writeoffs = dq_data.get('writeoffs', {})
@@ -164,8 +182,8 @@ async def generate_writeoff_questions(dq_data: Dict[str, Any], openai_service: O
             if writeoff.get('criteria') in ['Converted Portfolio', 'Relevant Portfolio']:
                 net_loss = writeoff.get('net_loss_amount', 0)
                 
-                questions.append(Question(
-                    id=f"writeoffs_analysis_{datetime.now().strftime('%Y%m%d_%H%M%S')}",
+                questions.append(Question.model_construct(
+                    id=f"writeoffs_analysis_{ts}",
                     category="Writeoffs",
                     priority=QuestionPriority.MEDIUM,
                     question_text=f"Can you please check and provide additional information on the net loss amount (€{net_loss:,.2f}) and confirm the writeoff analysis? You'll find it in the 'Writeoff' sheet of the DQ report.",
@@ -186,7 +204,7 @@ async def generate_writeoff_questions(dq_data: Dict[str, Any], openai_service: O
     
     return questions
 
-async def generate_error_warning_questions(dq_data: Dict[str, Any], openai_service: OpenAIService) -> List[Question]:
+async def generate_error_warning_questions(dq_data: Dict[str, Any], openai_service: OpenAIService, ts: str) -> List[Question]:
     """Generate questions for errors and warnings"""
     questions = []
     warnings = dq_data.get('warnings', {})
@@ -199,8 +217,8 @@ async def generate_error_warning_questions(dq_data: Dict[str, Any], openai_servi
     if rule_warnings:
         total_contracts = sum(w.get('contracts', 0) for w in rule_warnings)
         
-        questions.append(Question(
-            id=f"warnings_rules_{datetime.now().strftime('%Y%m%d_%H%M%S')}",
+        questions.append(Question.model_construct(
+            id=f"warnings_rules_{ts}",
             category="Warnings",
             priority=QuestionPriority.MEDIUM,
             question_text=f"Can you please provide additional information for the warnings: {total_contracts} contracts with rule confirmation issues. What specific business rules are failing and what is your remediation plan?",
@@ -223,10 +241,13 @@ async def generate_error_warning_questions(dq_data: Dict[str, Any], openai_servi
 import json
 import logging
 from typing import Dict, Any
-from datetime import datetime
+from datetime import datetime, timezone
 from models.response_models import ResponseSubmissionRequest, ValidationResult
 from services.openai_service import OpenAIService
 
+# Shortest response the fallback validator accepts when AI validation is unavailable
+_MIN_FALLBACK_RESPONSE_LENGTH = 50
+
 async def process_response(
     questionnaire_id: str,
     request: ResponseSubmissionRequest,
@@ -246,7 +267,7 @@ async def process_response(
         "confidence_level": request.confidence_level,
         "uploaded_files": request.uploaded_files or [],
         "submitted_by": request.submitted_by,
-        "submitted_at": datetime.utcnow().isoformat(),
+        "submitted_at": datetime.now(timezone.utc).isoformat(timespec="seconds").replace("+00:00", "Z"),
         "ai_validated": validation.is_valid,
         "ai_validation_score": validation.validation_score,
         "ai_suggestions": validation.suggestions,
@@ -270,7 +291,7 @@ async def validate_response(
     """Validate response using AI"""
     
     if not request.response_text:
-        return ValidationResult(
+        return ValidationResult.model_construct(
             is_valid=False,
             validation_score=0.0,
             issues=["Response text is required"],
@@ -290,8 +311,8 @@ async def validate_response(
     except Exception as e:
         logging.error(f"AI validation failed: {str(e)}")
         # Fallback validation
-        return ValidationResult(
-            is_valid=len(request.response_text) >= 50,
+        return ValidationResult.model_construct(
+            is_valid=len(request.response_text) >= _MIN_FALLBACK_RESPONSE_LENGTH,
             validation_score=0.6,
             issues=["AI validation temporarily unavailable"],
             suggestions=["Please ensure response is complete and detailed"]
@@ -316,7 +337,7 @@ async def analyze_dq_report(report_data: Dict[str, Any], openai_service: OpenAIS
         "patterns_identified": patterns,
         "requires_attention": risk_score > 7.0,
         "summary": generate_summary(report_data),
-        "recommendations": generate_recommendations(report_data),
+        "recommendations": generate_recommendations(report_data, risk_score),
         "confidence": 0.89
     }
     
@@ -422,13 +443,11 @@ def generate_summary(report_data: Dict[str, Any]) -> str:
     
     return f"Report covers {total_contracts:,} contracts with €{delinquent_amount:,.2f} in delinquent amounts. Multiple high-impact changes detected requiring management attention."
 
-def generate_recommendations(report_data: Dict[str, Any]) -> list:
-    """Generate actionable recommendations"""
+def generate_recommendations(report_data: Dict[str, Any], risk_score: float) -> list:
+    """Generate actionable recommendations from the report and its precomputed risk score"""
     recommendations = []
     
     # Based on risk score and patterns
-    risk_score = calculate_risk_score(report_data)
-    
     if risk_score > 7:
         recommendations.append("Immediate escalation to senior management required")
         recommendations.append("Implement enhanced monitoring for delinquent accounts")
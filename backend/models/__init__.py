@@ -1,43 +1,95 @@
 """
 Models package for DQ Agent
 """
-"""
-Models package for DQ Agent
-"""
-from .dq_models import *
-from .question_models import *
-from .common_models import *
+from .dq_models import (
+    Severity,
+    DQReportMetadata,
+    PortfolioData,
+    OverviewSummary,
+    IssueIdentified,
+    OverviewData,
+    WriteoffData,
+    WriteoffSummary,
+    WriteoffFlags,
+    WriteoffSection,
+    ErrorData,
+    ErrorSummary,
+    ErrorSection,
+    WarningData,
+    WarningSummary,
+    WarningSection,
+    AdditionalInfoSummary,
+    AdditionalInfoCategories,
+    AdditionalInfoSection,
+    ThresholdBreach,
+    RiskAnalysis,
+    DQReport,
+)
+from .question_models import (
+    QuestionPriority,
+    ResponseType,
+    ResponseStatus,
+    ConfidenceLevel,
+    Question,
+    QuestionResponse,
+    QuestionnaireProgress,
+    Questionnaire,
+    QuestionGenerationRequest,
+    QuestionGenerationSummary,
+    QuestionGenerationResponse,
+    ResponseSubmissionRequest,
+    ValidationResult,
+)
+from .common_models import (
+    ApiResponse,
+    Country,
+    UserProfile,
+    HealthCheck,
+)
 
-__all__ = [
+__all__ = (
     # DQ Models
-    'DataQualityCheck',
-    'DataQualityResult', 
-    'DataSource',
-    'DQProfile',
+    'Severity',
+    'DQReportMetadata',
+    'PortfolioData',
+    'OverviewSummary',
+    'IssueIdentified',
+    'OverviewData',
+    'WriteoffData',
+    'WriteoffSummary',
+    'WriteoffFlags',
+    'WriteoffSection',
+    'ErrorData',
+    'ErrorSummary',
+    'ErrorSection',
+    'WarningData',
+    'WarningSummary',
+    'WarningSection',
+    'AdditionalInfoSummary',
+    'AdditionalInfoCategories',
+    'AdditionalInfoSection',
+    'ThresholdBreach',
+    'RiskAnalysis',
     'DQReport',
     
     # Question Models
+    'QuestionPriority',
+    'ResponseType',
+    'ResponseStatus',
+    'ConfidenceLevel',
     'Question',
-    'QueryRequest',
-    'QueryResponse',
-    'ChatMessage',
-    'ChatSession',
+    'QuestionResponse',
+    'QuestionnaireProgress',
+    'Questionnaire',
+    'QuestionGenerationRequest',
+    'QuestionGenerationSummary',
+    'QuestionGenerationResponse',
+    'ResponseSubmissionRequest',
+    'ValidationResult',
     
-    # Add any models from common_models here
-]
-
-__all__ = [
-    # DQ Models
-    'DataQualityCheck',
-    'DataQualityResult', 
-    'DataSource',
-    'DQProfile',
-    'DQReport',
-    
-    # Question Models
-    'Question',
-    'QueryRequest',
-    'QueryResponse',
-    'ChatMessage',
-    'ChatSession',
-]
\ No newline at end of file
+    # Common Models
+    'ApiResponse',
+    'Country',
+    'UserProfile',
+    'HealthCheck',
+)
@@ -0,0 +1,111 @@
+# backend/services/llm_cache.py
+import asyncio
+import hashlib
+import logging
+import time
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+import orjson
+from cachetools import TTLCache
+
+_log = logging.getLogger(__name__)
+
+# Completions above this temperature are expected to vary between calls and are never cached
+MAX_CACHEABLE_TEMPERATURE = 0.3
+
+# Completion text keyed by a hash of everything sent to the model, kept for an hour per worker
+_COMPLETION_CACHE = TTLCache(maxsize=1024, ttl=3600)
+
+# Completions currently being generated, keyed like the cache, so identical concurrent requests
+# wait on one call instead of each paying for it
+_IN_FLIGHT: Dict[str, asyncio.Task] = {}
+
+# After this many consecutive failed completions (each already retried by the SDK), calls fail
+# fast for BREAKER_RESET_SECONDS instead of queueing behind a degraded deployment
+BREAKER_FAIL_MAX = 5
+BREAKER_RESET_SECONDS = 60
+
+_BREAKER = {"failures": 0, "opened_at": 0.0}
+
+class CircuitOpenError(Exception):
+    """Raised instead of calling Azure OpenAI while the circuit breaker is open"""
+
+def _is_service_error(exc: Exception) -> bool:
+    """Connection, timeout, 429 and 5xx errors mean the service, not the request, is at fault"""
+    # The SDK is imported lazily by the app and is always loaded once a client has made a call
+    import openai
+    return isinstance(exc, (openai.APIConnectionError, openai.RateLimitError, openai.InternalServerError))
+
+def completion_cache_key(model: str, messages: List[Dict[str, Any]], temperature: float, **params: Any) -> str:
+    """Hash the deployment, messages, temperature and remaining request options into a stable key"""
+    payload = orjson.dumps({
+        "model": model,
+        "messages": messages,
+        "temperature": temperature,
+        "params": params
+    }, option=orjson.OPT_SORT_KEYS | orjson.OPT_NON_STR_KEYS)
+    return hashlib.sha256(payload).hexdigest()
+
+def log_prompt_cache_usage(model: str, response: Any) -> None:
+    """Log how many prompt tokens Azure OpenAI served from its own prefix cache"""
+    usage = getattr(response, "usage", None)
+    details = getattr(usage, "prompt_tokens_details", None)
+    cached_tokens = getattr(details, "cached_tokens", None)
+    if cached_tokens is not None:
+        _log.info("Prompt tokens for %s: %s, served from prefix cache: %s", model, usage.prompt_tokens, cached_tokens)
+
+async def single_flight(key: str, call: Callable[[], Awaitable[Any]]) -> Any:
+    """Run call() once for all concurrent callers with the same key and share its outcome"""
+    task = _IN_FLIGHT.get(key)
+    if task is None:
+        task = asyncio.ensure_future(call())
+        _IN_FLIGHT[key] = task
+        task.add_done_callback(lambda _: _IN_FLIGHT.pop(key, None))
+    else:
+        _log.info("Joining in-flight completion %s", key[:12])
+    # Shielded so one caller going away does not cancel the call for the others
+    return await asyncio.shield(task)
+
+async def create_completion(client, **params: Any) -> Any:
+    """Call chat.completions.create through the circuit breaker and log prompt cache usage"""
+    if _BREAKER["failures"] >= BREAKER_FAIL_MAX:
+        remaining = BREAKER_RESET_SECONDS - (time.monotonic() - _BREAKER["opened_at"])
+        if remaining > 0:
+            raise CircuitOpenError(f"Azure OpenAI temporarily unavailable, retry in {remaining:.0f}s")
+
+    try:
+        response = await client.chat.completions.create(**params)
+    except Exception as e:
+        if _is_service_error(e):
+            _BREAKER["failures"] += 1
+            if _BREAKER["failures"] >= BREAKER_FAIL_MAX:
+                _BREAKER["opened_at"] = time.monotonic()
+                _log.error("Opening Azure OpenAI circuit after %s consecutive failures", _BREAKER["failures"])
+        raise
+
+    _BREAKER["failures"] = 0
+    log_prompt_cache_usage(params.get("model"), response)
+    return response
+
+async def cached_completion(client, model: str, messages: List[Dict[str, Any]], temperature: float,
+                            validate: Optional[Callable[[str], bool]] = None, **params: Any) -> str:
+    """Return the message content of a chat completion, reusing an identical earlier request's reply"""
+    cacheable = temperature <= MAX_CACHEABLE_TEMPERATURE
+    if cacheable:
+        key = completion_cache_key(model, messages, temperature, **params)
+        content = _COMPLETION_CACHE.get(key)
+        if content is not None:
+            _log.info("Completion cache hit for %s", model)
+            return content
+
+    async def call() -> str:
+        response = await create_completion(client, model=model, messages=messages, temperature=temperature, **params)
+        content = response.choices[0].message.content
+        # A reply validate() rejects is still returned, but the next identical request asks again
+        if cacheable and content and (validate is None or validate(content)):
+            _COMPLETION_CACHE[key] = content
+        return content
+
+    if not cacheable:
+        return await call()
+    return await single_flight(key, call)
@@ -0,0 +1,37 @@
+# backend/utils/json_response.py
+from typing import Any
+
+import azure.functions as func
+import orjson
+from pydantic import BaseModel
+
+# CORS, including preflight, is handled by the Functions host (Host.CORS locally, the Function
+# App CORS setting when deployed), so responses only carry a shared content type header
+JSON_HEADERS = {"Content-Type": "application/json"}
+
+# Naive datetimes in payloads are UTC and are emitted with a Z suffix
+_JSON_OPTIONS = orjson.OPT_NAIVE_UTC | orjson.OPT_UTC_Z
+
+def _json_default(obj: Any) -> Any:
+    """Serialize types orjson does not handle natively (datetime, enum and UUID are native)"""
+    if isinstance(obj, BaseModel):
+        return obj.model_dump()
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+def json_response(payload: Any, status_code: int = 200) -> func.HttpResponse:
+    """Serialize payload with orjson and return it as a JSON response"""
+    return func.HttpResponse(
+        orjson.dumps(payload, default=_json_default, option=_JSON_OPTIONS),
+        status_code=status_code,
+        headers=JSON_HEADERS
+    )
+
+def read_json_body(req: func.HttpRequest) -> Any:
+    """Parse the request body with orjson; returns None when the body is empty or not valid JSON"""
+    raw = req.get_body()
+    if not raw:
+        return None
+    try:
+        return orjson.loads(raw)
+    except orjson.JSONDecodeError:
+        return None